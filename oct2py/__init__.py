@@ -24,30 +24,58 @@ __version__ = '1.2.0'
 __author__ = 'Steven Silvester'
 __license__ = 'MIT'
 __copyright__ = 'Copyright 2013 Steven Silvester'
-__all__ = ['Oct2Py', 'Oct2PyError', 'octave', 'Struct', 'demo', 'speed_test',
-           'thread_test', '__version__', 'get_log']
+__all__ = ['Oct2Py', 'Oct2PyError', 'octave', 'Struct', 'FrozenStruct',
+           'OctaveRef',
+           'Oct2PyPool', 'demo',
+           'speed_test', 'thread_test', '__version__', 'get_log']
 
 
-import imp
-import functools
-import os
+import importlib
+import sys
 
-from .session import Oct2Py, Oct2PyError
-from .utils import Struct, get_log
+from .session import Oct2Py, Oct2PyError, _GlobalOct2Py
+from .refs import OctaveRef
+from .pool import Oct2PyPool
+try:
+    from .executor import Oct2PyExecutor
+    __all__ += ['Oct2PyExecutor']
+except ImportError:  # pragma: no cover
+    pass
+from .utils import Struct, FrozenStruct, get_log
 from .demo import demo
-from .speed_check import speed_test
-from .thread_check import thread_test
 
 
-try:
-    octave = Oct2Py()
-except Oct2PyError as e:
-    print(e)
+# imported on first use where the module can say so (Python 3.7+)
+_LAZY = dict(speed_test='speed_check', thread_test='thread_check')
+if sys.version_info >= (3, 5):
+    _LAZY.update(AsyncOct2Py='async_session', AsyncOct2PyPool='async_session')
+    __all__ += ['AsyncOct2Py', 'AsyncOct2PyPool']
+
+
+def _load(name):
+    """Import a lazy name and keep it in the package namespace"""
+    module = importlib.import_module('.' + _LAZY[name], __name__)
+    value = globals()[name] = getattr(module, name)
+    return value
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in _LAZY:
+            return _load(name)
+        raise AttributeError(
+            "module '{0}' has no attribute '{1}'".format(__name__, name))
+else:  # pragma: no cover
+    for _name in _LAZY:
+        _load(_name)
+
+
+# Octave is started the first time the global session is used
+octave = _GlobalOct2Py()
 
 # clean up namespace
-del functools, imp, os
+del sys
 try:
-    del session, utils
+    del session, utils, refs, pool
 except NameError:  # pragma: no cover
     pass
-
@@ -0,0 +1,28 @@
+function x = __oct2py_bulk_read__(path)
+% Read an array from a raw file written by oct2py.
+% The file holds [class code, complex flag, ndims] as int32,
+% the dimensions as int64, then the data in column-major order.
+% The file is removed once it has been read.
+
+  classes = {'double', 'single', 'int8', 'int16', 'int32', 'int64', ...
+             'uint8', 'uint16', 'uint32', 'uint64'};
+  [fid, msg] = fopen(path, 'r');
+  if fid < 0
+    error('oct2py:bulk', 'Could not open %s: %s', path, msg);
+  end
+  header = fread(fid, 3, 'int32');
+  dims = fread(fid, [1, header(3)], 'int64');
+  cls = classes{header(1) + 1};
+  precision = [cls '=>' cls];
+  n = prod(dims);
+  if header(2)
+    x = fread(fid, [2, n], precision);
+    x = complex(x(1, :), x(2, :));
+  else
+    x = fread(fid, n, precision);
+  end
+  fclose(fid);
+  unlink(path);
+  x = reshape(x, dims);
+
+end
@@ -0,0 +1,21 @@
+function __oct2py_bulk_save__(outfile, prefix, min_size, varargin)
+% Save variables from the calling workspace for oct2py.
+% Dense numeric arrays with at least min_size elements are written
+% as raw files named prefix + name, the rest go to the MAT outfile.
+
+  names = {};
+  for i = 1:numel(varargin)
+    name = varargin{i};
+    x = evalin('caller', name);
+    if isnumeric(x) && ~issparse(x) && numel(x) >= min_size
+      __oct2py_bulk_write__([prefix name], x);
+    else
+      names{end + 1} = name;
+    end
+  end
+  if ~isempty(names)
+    evalin('caller', sprintf('save "-v6" "%s"%s', outfile, ...
+                             sprintf(' "%s"', names{:})));
+  end
+
+end
@@ -0,0 +1,19 @@
+function __oct2py_bulk_write__(path, x)
+% Write an array to a raw file for oct2py.
+% See __oct2py_bulk_read__ for the file layout.
+
+  classes = {'double', 'single', 'int8', 'int16', 'int32', 'int64', ...
+             'uint8', 'uint16', 'uint32', 'uint64'};
+  cls = class(x);
+  code = find(strcmp(classes, cls)) - 1;
+  fid = fopen(path, 'w');
+  fwrite(fid, [code, iscomplex(x), ndims(x)], 'int32');
+  fwrite(fid, size(x), 'int64');
+  if iscomplex(x)
+    fwrite(fid, [real(x(:)).'; imag(x(:)).'], cls);
+  else
+    fwrite(fid, x, cls);
+  end
+  fclose(fid);
+
+end
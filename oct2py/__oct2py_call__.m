@@ -0,0 +1,27 @@
+function __oct2py_call__(func, nout, infile, outfile, loaded, varargin)
+% Call a function for oct2py in a single short command.
+% The inputs are varargin, except at the positions in loaded, which hold
+% the names of variables in the MAT infile.  The outputs are saved in the
+% MAT outfile as a__, b__, ..., and the status is reported with
+% __oct2py_frame__ like the usual command envelope does.
+
+  try
+    if ~isempty(loaded)
+      data = load(infile);
+      for i = loaded
+        varargin{i} = data.(varargin{i});
+      end
+    end
+    out = cell(1, nout);
+    [out{:}] = feval(func, varargin{:});
+    data = struct();
+    for i = 1:nout
+      data.(sprintf('%c__', 96 + i)) = out{i};
+    end
+    save('-v6', outfile, '-struct', 'data');
+    __oct2py_frame__(0, '');
+  catch
+    __oct2py_frame__(1, lasterr());
+  end
+
+end
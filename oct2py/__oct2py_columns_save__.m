@@ -0,0 +1,41 @@
+function __oct2py_columns_save__(outfile, varargin)
+% Save variables from the calling workspace for oct2py, with each struct
+% array turned into a scalar struct of columns first.  Fields whose values
+% are all numeric or logical scalars of one class become row vectors, the
+% other fields row cells.  The names of the converted variables are saved
+% in oct2py_columns__.
+
+  out = struct();
+  converted = {};
+  for i = 1:numel(varargin)
+    name = varargin{i};
+    x = evalin('caller', name);
+    if isstruct(x) && numel(x) ~= 1
+      x = columns(x);
+      converted{end + 1} = name;
+    end
+    out.(name) = x;
+  end
+  out.oct2py_columns__ = converted;
+  save('-v6', outfile, '-struct', 'out');
+
+end
+
+
+function cols = columns(x)
+% Turn a struct array into a scalar struct of columns.
+
+  cols = struct();
+  fields = fieldnames(x);
+  for i = 1:numel(fields)
+    values = reshape({x.(fields{i})}, 1, []);
+    if ~isempty(values) && (isnumeric(values{1}) || islogical(values{1})) ...
+        && all(cellfun('prodofsize', values) == 1) ...
+        && all(cellfun('isclass', values, class(values{1})))
+      cols.(fields{i}) = [values{:}];
+    else
+      cols.(fields{i}) = values;
+    end
+  end
+
+end
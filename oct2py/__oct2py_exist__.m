@@ -0,0 +1,16 @@
+function __oct2py_exist__(varargin)
+% Check that variables exist in the caller's workspace for oct2py.
+% Raises one error listing every missing name, after the prefix
+% 'oct2py: variables not found: '.
+
+  missing = {};
+  for i = 1:nargin
+    if ~evalin('caller', sprintf('exist(''%s'', ''var'')', varargin{i}))
+      missing{end + 1} = varargin{i};
+    end
+  end
+  if ~isempty(missing)
+    error('oct2py: variables not found: %s', strjoin(missing, ' '));
+  end
+
+end
@@ -0,0 +1,31 @@
+function __oct2py_frame__(status, msg)
+% Report the end of a command to oct2py.
+% Prints an end marker after the command output, then sends a frame on
+% the pipe given by OCT2PY_FRAME_FD: 'OC2P', the status, the message
+% length and the path stamp as uint32, followed by the message.  The path
+% stamp goes up whenever the working directory or the path differ from
+% what they were at the previous frame.  Figures created by the command
+% are refreshed first.
+
+  __oct2py_refresh__();
+  persistent fid last stamp
+  if isempty(fid)
+    mlock();
+    fid = fopen(['/dev/fd/' getenv('OCT2PY_FRAME_FD')], 'w');
+    last = '';
+    stamp = 0;
+  end
+  current = [pwd() pathsep() path()];
+  if ~strcmp(current, last)
+    last = current;
+    stamp = stamp + 1;
+  end
+  fputs(stdout, char([3 21 3 10]));
+  fflush(stdout);
+  msg = uint8(msg);
+  fwrite(fid, uint8('OC2P'), 'uint8');
+  fwrite(fid, [status, numel(msg), stamp], 'uint32');
+  fwrite(fid, msg, 'uint8');
+  fflush(fid);
+
+end
@@ -0,0 +1,23 @@
+function __oct2py_info__(name)
+% Print what oct2py needs to know about a function, one item per line:
+% its m-file (empty for built-ins), its exist code, nargin and nargout
+% (NaN when Octave cannot tell).
+
+  file = which(name);
+  if numel(file) < 2 || ~strcmp(file(end-1:end), '.m')
+    file = '';
+  end
+  disp(file);
+  disp(exist(name));
+  try
+    disp(nargin(name));
+  catch
+    disp(NaN);
+  end
+  try
+    disp(nargout(name));
+  catch
+    disp(NaN);
+  end
+
+end
@@ -0,0 +1,17 @@
+function __oct2py_refresh__()
+% Refresh the figures created since the last call, so they are drawn.
+% The list is filled by the figure create function set up by oct2py, and
+% stays empty in sessions without graphics.
+
+  global __oct2py_figures
+  if isempty(__oct2py_figures)
+    return
+  end
+  for f = __oct2py_figures
+    try
+      refresh(f);
+    end
+  end
+  __oct2py_figures = [];
+
+end
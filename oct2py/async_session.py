@@ -0,0 +1,504 @@
+"""
+.. module:: async_session
+   :synopsis: Octave sessions for asyncio.
+              Requires Python 3.5 or newer.
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import asyncio
+import functools
+import os
+import re
+import sys
+from subprocess import PIPE, STDOUT
+from .matwrite import MatWrite, INLINE_MAX
+from .matread import MatRead
+from .bulkio import MIN_SIZE
+from .session import (_Session, _Output, _call_line, _decode, _frame_header,
+                      _launch_options, _preload, _search_path, exist_line,
+                      missing_error, BOOT_QUERY, FRAME_SIZE, HEADLESS_WARM_UP,
+                      PROFILES, SYNTAX_ERROR, WARM_UP, BUFSIZE)
+from .utils import Oct2PyError, get_log
+
+
+class AsyncOct2Py(object):
+    """Manages an Octave session from asyncio.
+
+    Commands are written to Octave without blocking the event loop, and
+    MAT files are written and read in the loop's default executor.  The
+    session runs one command at a time; use `AsyncOct2PyPool` to spread
+    concurrent calls over several sessions.
+
+    The session is started by `start`, by entering it with ``async with``,
+    or by the first command.  It takes the launch profile (`executable`,
+    `args`, `env`, `paths` and `packages`) and `graphics` setting of
+    `Oct2Py`, and is warmed up the same way as it starts.  Use `aclose`
+    to wait for Octave to exit.  Only POSIX systems are supported, since
+    the command status is read from a dedicated pipe.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        async with AsyncOct2Py() as oc:
+            x = await oc.ones(3, 3)
+            await oc.put('y', x)
+            y = await oc.get('y')
+
+    """
+    def __init__(self, logger=None, shared_memory=False,
+                 inline_max=INLINE_MAX, bulk_min=MIN_SIZE,
+                 strict_dtypes=False, executable='octave', args='default',
+                 env=None, paths=None, packages=None, graphics=True):
+        if not logger is None:
+            self.logger = logger
+        else:
+            self.logger = get_log()
+        self._launch = _launch_options(executable, args, env, paths,
+                                       packages, graphics)
+        self._session = _AsyncSession(**self._launch)
+        self._reader = MatRead(shared_memory, bulk_min, strict_dtypes)
+        self._writer = MatWrite(shared_memory, inline_max, bulk_min,
+                                strict_dtypes)
+        self._lock = None
+        self._added_paths = set()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.aclose()
+
+    async def start(self):
+        """Start Octave, if it is not running already
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._session.proc:
+                await self._session.start(self.logger)
+                self._added_paths = set(self._launch['paths'])
+
+    def close(self):
+        """Closes this octave session and removes temp files
+
+        Octave is asked to exit, but not waited for; use `aclose` from a
+        running event loop.
+        """
+        self._session.close()
+        self._writer.remove_file()
+        self._reader.remove_file()
+
+    async def aclose(self):
+        """Close this octave session, wait for Octave to exit and remove
+        temp files
+        """
+        await self._session.aclose()
+        self._writer.remove_file()
+        self._reader.remove_file()
+
+    async def run(self, script, verbose=False):
+        """
+        Run artibrary Octave code.
+
+        Parameters
+        -----------
+        script : str
+            Command script to send to Octave for execution.
+        verbose : bool, optional
+            Log Octave output at info level.
+
+        Returns
+        -------
+        out : str
+            Octave printed output.
+
+        """
+        return await self.call(script, nout=0, verbose=verbose)
+
+    async def call(self, func, *inputs, nout=1, verbose=False):
+        """
+        Call an Octave function with optional arguments.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        inputs : array_like
+            Variables to pass to the function.
+        nout : int, optional
+            Number of output arguments, 1 by default.  The number of values
+            requested cannot be detected through ``await``.
+        verbose : bool, optional
+             Log Octave output at info level.
+
+        Returns
+        -------
+        out : object or tuple
+            If nout > 0, returns the values from Octave.
+            Otherwise, returns the output displayed by Octave.
+
+        Raises
+        ------
+        Oct2PyError
+            If the call is unsucessful.
+
+        """
+        await self.start()
+        loop = asyncio.get_event_loop()
+        async with self._lock:
+            func = await self._resolve_func(func)
+            load_line = save_line = ''
+            argin_list = argout_list = []
+            if nout:
+                argout_list, save_line = self._reader.setup(nout)
+            if inputs:
+                argin_list, load_line = await loop.run_in_executor(
+                    None, self._writer.create_file, inputs)
+            call_line = _call_line(func, argin_list, argout_list)
+            resp = await self._eval([load_line, call_line, save_line],
+                                    verbose=verbose)
+            if not nout:
+                return resp
+            return await loop.run_in_executor(
+                None, self._reader.extract_file, argout_list)
+
+    async def put(self, names, var, verbose=False):
+        """
+        Put a variable into the Octave session.
+
+        Parameters
+        ----------
+        names : str or list
+            Name of the variable(s).
+        var : object or list
+            The value(s) to pass.
+
+        """
+        if isinstance(names, str):
+            var = [var]
+            names = [names]
+        for name in names:
+            if name.startswith('_'):
+                raise Oct2PyError('Invalid name {0}'.format(name))
+        await self.start()
+        loop = asyncio.get_event_loop()
+        async with self._lock:
+            _, load_line = await loop.run_in_executor(
+                None, functools.partial(self._writer.create_file, var,
+                                        list(names)))
+            await self._eval(load_line, verbose=verbose)
+
+    async def get(self, var, verbose=False):
+        """
+        Retrieve a value from the Octave session.
+
+        Parameters
+        ----------
+        var : str or list
+            Name of the variable(s) to retrieve.
+
+        Returns
+        -------
+        out : object
+            Object returned by Octave.
+
+        Raises
+        ------
+        Oct2PyError
+            If the variable does not exist in the Octave session.
+
+        """
+        if isinstance(var, str):
+            var = [var]
+        await self.start()
+        loop = asyncio.get_event_loop()
+        async with self._lock:
+            argout_list, save_line = self._reader.setup(len(var), list(var))
+            try:
+                await self._eval([exist_line(argout_list), save_line],
+                                 verbose=verbose)
+            except Oct2PyError as err:
+                raise missing_error(err)
+            return await loop.run_in_executor(
+                None, self._reader.extract_file, argout_list)
+
+    async def _resolve_func(self, func):
+        """Handle paths to m-files, adding their directory to the path once
+        per session, the lock must be held
+        """
+        if func.endswith('.m'):
+            dirname = os.path.dirname(func)
+            if dirname and not dirname in self._added_paths:
+                await self._eval("addpath('{0}')".format(
+                    dirname.replace("'", "''")), verbose=False)
+                self._added_paths.add(dirname)
+            func = os.path.basename(func)[:-2]
+        return func
+
+    async def _eval(self, cmds, verbose=True):
+        """Perform raw Octave command(s), the lock must be held
+        """
+        if isinstance(cmds, str):
+            cmds = [cmds]
+        if verbose:
+            [self.logger.info(line) for line in cmds]
+        else:
+            [self.logger.debug(line) for line in cmds]
+        return await self._session.evaluate(cmds, verbose, True, self.logger)
+
+    def __getattr__(self, attr):
+        """Automatically creates a coroutine wrapper to an Octave function.
+        """
+        if re.search(r'\W', attr) or attr.startswith('_'):
+            raise AttributeError(attr)
+        # print_ -> print
+        if attr[-1] == "_":
+            name = attr[:-1]
+        else:
+            name = attr
+
+        async def octave_command(*args, **kwargs):
+            """ Octave command """
+            return await self.call(name, *args, **kwargs)
+        octave_command.__name__ = name
+        return octave_command
+
+
+class AsyncOct2PyPool(object):
+    """Spread concurrent calls from asyncio over several Octave sessions.
+
+    Each call waits for an idle session, so up to `processes` calls run
+    at once.  Keyword arguments other than `processes` are passed to
+    each `AsyncOct2Py`.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        async with AsyncOct2PyPool(4) as pool:
+            sizes = await pool.map('numel', [[1, 2], [1, 2, 3]])
+
+    """
+    def __init__(self, processes=4, **kwargs):
+        if processes < 1:
+            raise ValueError('Number of processes must be at least 1')
+        self._sessions = [AsyncOct2Py(**kwargs) for i in range(processes)]
+        self._idle = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.aclose()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def start(self):
+        """Start all the sessions
+        """
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        await asyncio.gather(*[oc.start() for oc in self._sessions])
+        for oc in self._sessions:
+            self._idle.put_nowait(oc)
+
+    async def call(self, func, *inputs, **kwargs):
+        """
+        Call an Octave function on the next idle session.
+
+        See `AsyncOct2Py.call` for the arguments.
+
+        """
+        await self.start()
+        oc = await self._idle.get()
+        try:
+            return await oc.call(func, *inputs, **kwargs)
+        finally:
+            self._idle.put_nowait(oc)
+
+    async def map(self, func, iterable, **kwargs):
+        """
+        Call an Octave function once for each value, concurrently.
+
+        Returns
+        -------
+        out : list
+            Results, in the order of the inputs.
+
+        """
+        return await asyncio.gather(*[self.call(func, item, **kwargs)
+                                      for item in iterable])
+
+    def close(self):
+        """Close all the sessions, without waiting for them to exit
+        """
+        for oc in self._sessions:
+            oc.close()
+
+    async def aclose(self):
+        """Close all the sessions and wait for them to exit
+        """
+        await asyncio.gather(*[oc.aclose() for oc in self._sessions])
+
+
+class _AsyncSession(_Session):
+    '''Octave subprocess driven by asyncio streams
+
+    Uses the same frame protocol, command line and start up commands as
+    `_Session`.  Output is read from stdout up to the end marker, then the
+    status frame is read from its pipe.
+    '''
+    def __init__(self, executable='octave', args=None, env=None,
+                 paths=None, packages=None, graphics=True):
+        self._frame_fd = None
+        self._frame = None
+        self.proc = None
+        self.path_stamp = 0
+        self.graphics = graphics
+        self.executable = executable
+        self.args = PROFILES['default'] if args is None else args
+        self.env = env
+        self.paths = paths or []
+        self.packages = packages or []
+
+    async def start(self, logger=None):
+        """
+        Start an octave session in a subprocess, and warm it up.
+
+        Raises
+        ======
+        Oct2PyError
+            If the session is not opened sucessfully.
+
+        """
+        if not 'posix' in sys.builtin_module_names:  # pragma: no cover
+            raise Oct2PyError('AsyncOct2Py is only supported on POSIX')
+        loop = asyncio.get_event_loop()
+        self._frame_fd, frame_w = os.pipe()
+        env = dict(os.environ, **(self.env or {}))
+        env['OCT2PY_FRAME_FD'] = str(frame_w)
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                *self._command(), stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+                env=env, pass_fds=(frame_w,))
+        except OSError:  # pragma: no cover
+            os.close(self._frame_fd)
+            self._frame_fd = None
+            msg = ('\n\nPlease install GNU Octave and put it in your path\n')
+            raise Oct2PyError(msg)
+        finally:
+            os.close(frame_w)
+        self._frame = asyncio.StreamReader()
+        protocol = asyncio.StreamReaderProtocol(self._frame)
+        # the transport owns the read end from here on
+        pipe = os.fdopen(self._frame_fd, 'rb', 0)
+        self._frame_fd = None
+        self._frame_transport, _ = await loop.connect_read_pipe(
+            lambda: protocol, pipe)
+        try:
+            self._read_boot(await self.evaluate(BOOT_QUERY, False, False))
+            if self.packages:
+                resp = await self.evaluate(_preload(self.packages), False,
+                                           False)
+                self.search_path = _search_path(resp)
+            await self.warm_up(logger)
+        except Oct2PyError:
+            await self.aclose()
+            raise
+
+    async def warm_up(self, logger=None):
+        '''Select the graphics toolkit and set up the plot renderer, as
+        `_Session.warm_up` does
+        '''
+        if not self.graphics:
+            await self.evaluate([HEADLESS_WARM_UP], False, True, logger)
+            return
+        try:
+            await self.evaluate(["graphics_toolkit('gnuplot')"], False, True,
+                                logger)
+        except Oct2PyError:  # pragma: no cover
+            pass
+        await self.evaluate([WARM_UP], False, True, logger)
+
+    async def evaluate(self, cmds, verbose=True, log=True, logger=None):
+        '''Perform the low-level interaction with an Octave Session
+        '''
+        if not self.proc:
+            raise Oct2PyError('Session Closed, try a restart()')
+        lines = ['try', '\n'.join(cmds), '__oct2py_frame__(0, "")',
+                 'catch', '__oct2py_frame__(1, lasterr())',
+                 'end', '']
+        self.proc.stdin.write('\n'.join(lines).encode('utf-8'))
+        await self.proc.stdin.drain()
+        status, error, resp = await self._read_frame()
+        if status == SYNTAX_ERROR:
+            msg = 'Octave Syntax Error:\n' + resp
+            msg += '\nSession Closed by Octave'
+            self.close()
+            raise Oct2PyError(msg)
+        if resp:
+            if verbose and logger:
+                logger.info(resp)
+            elif log and logger:
+                logger.debug(resp)
+        if status:
+            resp = '\n'.join([line for line in (resp, error) if line])
+            raise Oct2PyError(self._error_msg(cmds, resp))
+        return resp
+
+    async def _read_frame(self):
+        '''Read the printed output and status frame of a command
+
+        Returns
+        =======
+        out : tuple (int, str, str)
+            Status code, error message and printed output.
+
+        '''
+        output = _Output()
+        while not output.done():
+            chunk = await self.proc.stdout.read(BUFSIZE)
+            if not chunk:
+                self.close()
+                raise Oct2PyError('Session died unexpectedly')
+            if output.feed(chunk):
+                return SYNTAX_ERROR, '', output.text()
+        try:
+            status, size, self.path_stamp = _frame_header(
+                await self._frame.readexactly(FRAME_SIZE))
+            error = await self._frame.readexactly(size)
+        except asyncio.IncompleteReadError:
+            self.close()
+            raise Oct2PyError('Session died unexpectedly')
+        return status, _decode(error), output.text()
+
+    def close(self):
+        '''Close the Octave session
+        '''
+        if self.proc:
+            try:
+                self.proc.stdin.write(b'exit\n')
+            except (IOError, AttributeError):  # pragma: no cover
+                pass
+            try:
+                self.proc.terminate()
+            except (OSError, ProcessLookupError):  # pragma: no cover
+                pass
+        self.proc = None
+        if self._frame is not None:
+            self._frame_transport.close()
+            self._frame = None
+
+    async def aclose(self):
+        '''Close the Octave session and wait for the process to exit
+        '''
+        proc = self.proc
+        self.close()
+        if proc:
+            await proc.wait()
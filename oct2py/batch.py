@@ -0,0 +1,172 @@
+"""
+.. module:: batch
+   :synopsis: Queue independent Octave calls and run them in one command.
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import re
+from .refs import OctaveRef
+from .utils import Future, Oct2PyError
+from .compat import unicode
+
+
+# prefix for the workspace variables used by a batch
+BATCH_PREFIX = '__oct2py_batch_'
+# collects "index char(2) message char(1)" for each failed call
+ERRORS = BATCH_PREFIX + 'errors'
+
+
+class Batch(object):
+    """Queue Octave calls and run them all in a single command.
+
+    Calls made through a batch return a `Future` right away.  When the
+    batch is flushed, which happens on leaving the ``with`` block, all
+    the queued inputs are written to one file, every call is run in one
+    command, and all the outputs come back in one file.  A failing call
+    only fails its own future.
+
+    Created by `Oct2Py.batch`.
+
+    """
+    def __init__(self, session):
+        self.session = session
+        self._queue = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
+            return
+        # nothing will run, do not leave anyone waiting
+        queue, self._queue = self._queue, []
+        for (_, _, _, future) in queue:
+            future.set_exception(Oct2PyError('Batch was not run'))
+
+    def call(self, func, *inputs, **kwargs):
+        """
+        Queue a call to an Octave function.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        inputs : array_like
+            Variables to pass to the function.
+        nout : int, optional
+            Number of output arguments, 1 by default.
+
+        Returns
+        -------
+        out : Future
+            Future for the value, or the tuple of values if nout > 1.
+
+        """
+        for arg in inputs:
+            if isinstance(arg, OctaveRef):
+                arg.check(self.session)
+        future = Future()
+        self._queue.append((self.session._resolve_func(func), inputs,
+                            kwargs.get('nout', 1), future))
+        return future
+
+    def flush(self, verbose=False):
+        """
+        Run the queued calls in a single command.
+
+        Parameters
+        ----------
+        verbose : bool, optional
+            Log Octave output at info level.
+
+        Raises
+        ------
+        Oct2PyError
+            If the batch as a whole could not be run.  Errors in single
+            calls are reported through their futures.
+
+        """
+        queue, self._queue = self._queue, []
+        if not queue:
+            return
+        session = self.session
+        try:
+            argout_list, lines = self._build(queue)
+            session._eval('\n'.join(lines), verbose=verbose)
+            values = session._reader.extract_file(argout_list)
+        except Exception as err:
+            for (_, _, _, future) in queue:
+                future.set_exception(err)
+            raise
+        if len(argout_list) == 1:
+            values = (values,)
+        errors = {}
+        if isinstance(values[-1], (str, unicode)):
+            for item in values[-1].split('\x01')[:-1]:
+                index, msg = item.split('\x02', 1)
+                errors[int(index)] = msg
+        pos = 0
+        for (index, (func, _, nout, future)) in enumerate(queue):
+            result = values[pos:pos + nout]
+            pos += nout
+            if index in errors:
+                msg = 'Octave call to {0} failed:\n{1}'.format(func,
+                                                               errors[index])
+                future.set_exception(Oct2PyError(msg))
+            elif nout == 0:
+                future.set_result(None)
+            elif nout == 1:
+                future.set_result(result[0])
+            else:
+                future.set_result(tuple(result))
+
+    def _build(self, queue):
+        """Build the command lines and output names for a queue of calls"""
+        from .session import _call_line
+        session = self.session
+        inputs = [arg for (_, args, _, _) in queue for arg in args]
+        argin_list = []
+        load_line = ''
+        if inputs:
+            argin_list, load_line = session._writer.create_file(inputs)
+        lines = [load_line, '{0} = "";'.format(ERRORS)]
+        argout_list = []
+        pos = 0
+        for (index, (func, args, nout, _)) in enumerate(queue):
+            names = ['{0}{1}_{2}'.format(BATCH_PREFIX, index, i)
+                     for i in range(nout)]
+            call_line = _call_line(func, argin_list[pos:pos + len(args)],
+                                   names)
+            pos += len(args)
+            # outputs must exist for the save, even if the call fails
+            for name in names:
+                lines.append('{0} = [];'.format(name))
+            lines.append('try\n{0};\ncatch\n{1} = [{1} "{2}" char(2) '
+                         'lasterr() char(1)];\nend'.format(call_line, ERRORS,
+                                                           index))
+            argout_list.extend(names)
+        argout_list.append(ERRORS)
+        argout_list, save_line = session._reader.setup(len(argout_list),
+                                                       argout_list)
+        lines.append(save_line)
+        lines.append('clear -v {0}*'.format(BATCH_PREFIX))
+        return argout_list, lines
+
+    def __getattr__(self, attr):
+        """Automatically creates a queueing wrapper to an Octave function.
+        """
+        if re.search(r'\W', attr) or attr.startswith('_'):
+            raise AttributeError(attr)
+        # print_ -> print
+        if attr[-1] == "_":
+            name = attr[:-1]
+        else:
+            name = attr
+
+        def batch_command(*args, **kwargs):
+            """ Queued Octave command """
+            return self.call(name, *args, **kwargs)
+        batch_command.__name__ = name
+        return batch_command
@@ -0,0 +1,248 @@
+"""
+.. module:: bulkio
+   :synopsis: Pass dense numeric arrays through raw files in shared memory.
+              Used in place of MAT files for large arrays.
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import errno
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+# Octave class names, indexed by the code stored in the file header
+CLASSES = ['double', 'single', 'int8', 'int16', 'int32', 'int64',
+           'uint8', 'uint16', 'uint32', 'uint64']
+# matching numpy type codes (kind + itemsize)
+DTYPES = ['f8', 'f4', 'i1', 'i2', 'i4', 'i8', 'u1', 'u2', 'u4', 'u8']
+COMPLEX = {'c16': 'f8', 'c8': 'f4'}
+
+# smallest array (in elements) worth sending outside of a MAT file
+MIN_SIZE = 1024
+
+# prefer a RAM backed file system when there is one
+if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+    SHM_DIR = '/dev/shm'
+else:  # pragma: no cover
+    SHM_DIR = None
+
+
+def create_dir():
+    """
+    Create a directory for raw array files, in shared memory if possible.
+
+    Returns
+    =======
+    out : str
+        Name of the new directory.
+
+    """
+    return tempfile.mkdtemp(prefix='oct2py_', dir=SHM_DIR)
+
+
+def get_code(dtype):
+    """
+    Get the header code for a numpy dtype.
+
+    Parameters
+    ==========
+    dtype : numpy.dtype
+        Type of the array.
+
+    Returns
+    =======
+    out : tuple (int, bool) or None
+        Class code and complex flag, or None if the dtype is not supported.
+
+    """
+    key = '{0}{1}'.format(dtype.kind, dtype.itemsize)
+    is_complex = key in COMPLEX
+    key = COMPLEX.get(key, key)
+    if not key in DTYPES:
+        return None
+    return DTYPES.index(key), is_complex
+
+
+def get_dtype(code, is_complex):
+    """Get the numpy dtype for a header code."""
+    dtype = np.dtype(DTYPES[code])
+    if is_complex:
+        dtype = np.dtype('c{0}'.format(dtype.itemsize * 2))
+    return dtype
+
+
+def reserve(fid, offset, size):
+    """
+    Allocate the space for the data of a raw file up front.
+
+    A sparse file in tmpfs is only backed by memory when it is written, so
+    filling a memory map of it fails with SIGBUS once /dev/shm is full.
+    Reserving the space turns that into an OSError.
+
+    Returns
+    =======
+    out : bool
+        Whether the space was reserved.  If not, the data must be written
+        through the file instead of a memory map.
+
+    """
+    if not hasattr(os, 'posix_fallocate'):  # pragma: no cover
+        return False
+    fid.flush()
+    try:
+        os.posix_fallocate(fid.fileno(), offset, size)
+    except OSError as err:  # pragma: no cover
+        if err.errno in (errno.EOPNOTSUPP, errno.EINVAL):
+            return False
+        raise
+    return True
+
+
+class BulkWrite(object):
+    """Write dense numeric arrays into raw files for Octave.
+
+    Each array is stored in its own file as a small header followed by
+    the data in column-major order, which Octave reads with ``fread``.
+    The payload is copied once, straight into a memory mapped file whose
+    space is reserved first, so a full shared memory raises an OSError.
+
+    """
+    def __init__(self, min_size=MIN_SIZE):
+        self.in_dir = create_dir()
+        self.min_size = min_size
+
+    def accepts(self, var):
+        """Check whether a value should be sent as a raw file."""
+        if not isinstance(var, np.ndarray) or var.size < self.min_size:
+            return False
+        return get_code(var.dtype) is not None
+
+    def write(self, name, data):
+        """
+        Write an array to a raw file.
+
+        Parameters
+        ==========
+        name : str
+            Name of the variable in the Octave session.
+        data : ndarray
+            Array to write.
+
+        Returns
+        =======
+        out : str
+            Octave command that reads the variable.
+
+        Raises
+        ======
+        OSError
+            If the file cannot be written, for example when the shared
+            memory is full.
+
+        """
+        data = np.asarray(data)
+        if data.ndim < 2:
+            data = data.reshape((1, -1))
+        code, is_complex = get_code(data.dtype)
+        header = (np.array([code, is_complex, data.ndim], np.int32).tobytes()
+                  + np.array(data.shape, np.int64).tobytes())
+        if not os.path.exists(self.in_dir):
+            self.in_dir = create_dir()
+        path = os.path.join(self.in_dir, name)
+        dtype = data.dtype.newbyteorder('=')
+        try:
+            with open(path, 'wb') as fid:
+                fid.write(header)
+                mapped = reserve(fid, len(header), data.nbytes)
+                if not mapped:
+                    # the transpose of a Fortran array is C contiguous
+                    np.asfortranarray(data, dtype).T.tofile(fid)
+        except (IOError, OSError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise
+        if mapped:
+            buf = np.memmap(path, dtype=dtype, mode='r+', offset=len(header),
+                            shape=data.shape, order='F')
+            buf[...] = data
+            del buf
+        return "{0} = __oct2py_bulk_read__('{1}');".format(name, path)
+
+    def remove_file(self):
+        shutil.rmtree(self.in_dir, ignore_errors=True)
+
+
+class BulkRead(object):
+    """Read dense numeric arrays from raw files written by Octave.
+    """
+    def __init__(self, min_size=MIN_SIZE):
+        self.out_dir = create_dir()
+        self.min_size = min_size
+
+    def setup(self, out_file, argout_list):
+        """
+        Generate the Octave save command.
+
+        Numeric arrays of at least `min_size` elements are written as raw
+        files, everything else is saved to `out_file` as usual.
+
+        Parameters
+        ==========
+        out_file : str
+            MAT file for the remaining variables.
+        argout_list : list
+            Variable names to save.
+
+        Returns
+        =======
+        out : str
+            Octave "save" command line.
+
+        """
+        if not os.path.exists(self.out_dir):
+            self.out_dir = create_dir()
+        # clear out stale files so we only see what this command writes
+        for name in argout_list:
+            try:
+                os.remove(os.path.join(self.out_dir, name))
+            except OSError:
+                pass
+        return "__oct2py_bulk_save__('{0}', '{1}', {2}, '{3}')".format(
+            out_file, self.out_dir + os.sep, self.min_size,
+            "', '".join(argout_list))
+
+    def read(self, name):
+        """
+        Read a variable from its raw file.
+
+        Parameters
+        ==========
+        name : str
+            Name of the variable.
+
+        Returns
+        =======
+        out : ndarray or None
+            The array, or None if Octave saved it to the MAT file instead.
+
+        """
+        path = os.path.join(self.out_dir, name)
+        try:
+            fid = open(path, 'rb')
+        except IOError:
+            return None
+        with fid:
+            code, is_complex, ndim = np.fromfile(fid, np.int32, 3)
+            dims = tuple(np.fromfile(fid, np.int64, ndim))
+            data = np.fromfile(fid, get_dtype(code, is_complex),
+                               int(np.prod(dims)))
+        os.remove(path)
+        return data.reshape(dims, order='F')
+
+    def remove_file(self):
+        shutil.rmtree(self.out_dir, ignore_errors=True)
@@ -0,0 +1,456 @@
+"""
+.. module:: cache
+   :synopsis: Remember what we learn about Octave functions.
+              Saved between sessions, one file per Octave version.
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+# where the function information is saved, set OCT2PY_CACHE_DIR to an
+# empty string to keep it in memory only
+CACHE_DIR = os.environ.get('OCT2PY_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache',
+                                        'oct2py'))
+
+# path states kept in a function cache file, the least recently used
+# are dropped first
+MAX_STATES = 16
+
+# path directories kept in a help index file, the least recently on the
+# path are dropped first
+MAX_DIRS = 512
+
+# caches already loaded by this process, by file name
+_CACHES = {}
+_LOCK = threading.Lock()
+
+
+def get_cache(version, cache_dir=None):
+    """
+    Get the function cache for an Octave version.
+
+    Sessions of the same version share one cache in each process.
+
+    Parameters
+    ==========
+    version : str
+        Octave version.
+    cache_dir : str, optional
+        Directory for the cache file, `CACHE_DIR` by default.
+
+    Returns
+    =======
+    out : FunctionCache
+        The cache.
+
+    """
+    return _shared(FunctionCache, 'functions', version, cache_dir)
+
+
+def get_index(version, cache_dir=None):
+    """
+    Get the help index for an Octave version.
+
+    Sessions of the same version share one index in each process.
+
+    Parameters
+    ==========
+    version : str
+        Octave version.
+    cache_dir : str, optional
+        Directory for the index file, `CACHE_DIR` by default.
+
+    Returns
+    =======
+    out : HelpIndex
+        The index.
+
+    """
+    return _shared(HelpIndex, 'index', version, cache_dir)
+
+
+def save_caches():
+    """Save the function caches loaded by this process that have changed"""
+    with _LOCK:
+        caches = list(_CACHES.values())
+    for cache in caches:
+        if isinstance(cache, FunctionCache):
+            cache.save()
+
+
+atexit.register(save_caches)
+
+
+def _shared(cls, prefix, version, cache_dir):
+    """Get the instance of `cls` for a version, creating it if needed"""
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, '{0}-{1}.json'.format(prefix, version))
+    with _LOCK:
+        if not (cls, path, version) in _CACHES:
+            _CACHES[(cls, path, version)] = cls(path)
+        return _CACHES[(cls, path, version)]
+
+
+class FunctionCache(object):
+    """Information about Octave functions, saved in a JSON file.
+
+    Entries are grouped by path state (see `path_state`), so the same name
+    can resolve to different files for sessions with a different working
+    directory or path, and a file added to a path directory invalidates
+    the entries for that path.  Each entry holds the m-file of the function
+    (None for built-ins), its modification time, the `exist` code,
+    `nargin`, `nargout` and the help text once it has been asked for.  An
+    entry for an m-file is only used while the file keeps the same
+    modification time.  Only the `MAX_STATES` most recently used path
+    states are kept in the file.  New entries are kept in memory until
+    `save` is called, which happens when a session is closed and when
+    Python exits.
+
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._states = self._load()
+        self._changed = False
+
+    def get(self, state, name):
+        """
+        Get the information about a function.
+
+        Parameters
+        ==========
+        state : str
+            Path state of the session.
+        name : str
+            Function name.
+
+        Returns
+        =======
+        out : dict or None
+            Copy of the entry, or None if it is not known or out of date.
+
+        """
+        with self._lock:
+            functions = self._states.get(state, {}).get('functions', {})
+            entry = functions.get(name)
+            if entry is None:
+                return None
+            if entry['file'] and mtime(entry['file']) != entry['mtime']:
+                del functions[name]
+                return None
+            return dict(entry)
+
+    def update(self, state, name, **info):
+        """Add to the information about a function"""
+        with self._lock:
+            group = self._states.setdefault(state, dict(functions={}))
+            group['used'] = time.time()
+            entry = group['functions'].setdefault(name, dict(file=None,
+                                                             mtime=None,
+                                                             doc=None))
+            entry.update(info)
+            self._changed = True
+
+    def save(self):
+        """Merge our entries into the file, if there are new ones"""
+        with self._lock:
+            if self._changed:
+                self._save()
+                self._changed = False
+
+    def _load(self):
+        states = _read_json(self.path)
+        # drop anything not written by this version of the cache
+        return dict((state, group) for (state, group) in states.items()
+                    if isinstance(group, dict) and 'functions' in group)
+
+    def _save(self):
+        """Merge our entries into the file"""
+        if not self.path:
+            return
+        states = self._load()
+        for (state, group) in self._states.items():
+            saved = states.setdefault(state, dict(functions={}))
+            saved['functions'].update(group['functions'])
+            saved['used'] = max(saved.get('used', 0), group.get('used', 0))
+        recent = sorted(states, key=lambda state: states[state].get('used', 0))
+        for state in recent[:-MAX_STATES]:
+            del states[state]
+        _write_json(self.path, states)
+
+
+class HelpIndex(object):
+    """Searchable index of the functions on the Octave path.
+
+    Built-in functions come from Octave's built-in docstrings file, and
+    the other functions from the files in each path directory, with the
+    help text read straight from the m-files.  Each directory is scanned
+    again only when its modification time changes, so keeping the index
+    up to date costs one stat per directory.  Searches use an inverted
+    index of the words in the names and help text.  Only the `MAX_DIRS`
+    directories most recently on the path are kept in the file.
+
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        data = _read_json(path)
+        self._builtins = data.get('builtins', dict(file=None, functions={}))
+        self._dirs = data.get('dirs', {})
+        self._active = None
+        self._functions = {}
+        self._words = {}
+
+    def update(self, dirs, docstrings=None):
+        """
+        Make the index match the Octave path.
+
+        Parameters
+        ==========
+        dirs : list of str
+            Directories on the path, in order.
+        docstrings : str, optional
+            Built-in docstrings file of the Octave installation.
+
+        """
+        with self._lock:
+            changed = False
+            now = time.time()
+            if docstrings != self._builtins['file']:
+                self._builtins = dict(file=docstrings,
+                                      functions=read_docstrings(docstrings))
+                changed = True
+            for dirname in dirs:
+                stamp = mtime(dirname)
+                entry = self._dirs.get(dirname)
+                if entry is None or entry['mtime'] != stamp:
+                    entry = dict(mtime=stamp, functions=scan_dir(dirname))
+                    self._dirs[dirname] = entry
+                    changed = True
+                entry['used'] = now
+            if changed:
+                self._drop_old(dirs)
+                self._save()
+            if changed or dirs != self._active:
+                self._active = list(dirs)
+                self._build()
+
+    def names(self):
+        """Names of all the functions in the index"""
+        with self._lock:
+            return sorted(self._functions)
+
+    def search(self, string):
+        """
+        Find the functions whose name or help text match every word.
+
+        Words match as substrings, case insensitively.
+
+        Parameters
+        ==========
+        string : str
+            Words to look for.
+
+        Returns
+        =======
+        out : list of tuple
+            (name, summary) pairs, functions whose name matches first.
+
+        """
+        terms = string.lower().split()
+        with self._lock:
+            found = None
+            for term in terms:
+                matches = set()
+                for word, names in self._words.items():
+                    if term in word:
+                        matches.update(names)
+                found = matches if found is None else found & matches
+            found = found or set()
+            return [(name, summary(self._functions[name])) for name in
+                    sorted(found, key=lambda name: (not terms[0] in
+                                                    name.lower(), name))]
+
+    def _build(self):
+        """Build the inverted index for the active directories"""
+        functions = {}
+        for dirname in reversed(self._active):
+            entry = self._dirs.get(dirname)
+            if entry:
+                functions.update(entry['functions'])
+        functions.update(self._builtins['functions'])
+        words = {}
+        for name, doc in functions.items():
+            for word in set(WORD.findall(name.lower() + ' ' + doc.lower())):
+                words.setdefault(word, []).append(name)
+        self._functions = functions
+        self._words = words
+
+    def _drop_old(self, dirs):
+        """Keep only the `MAX_DIRS` directories most recently on the path,
+        and the ones on it now"""
+        recent = sorted(self._dirs, key=lambda dirname:
+                        self._dirs[dirname].get('used', 0))
+        active = set(dirs)
+        for dirname in recent[:-MAX_DIRS]:
+            if not dirname in active:
+                del self._dirs[dirname]
+
+    def _save(self):
+        _write_json(self.path, dict(builtins=self._builtins, dirs=self._dirs))
+
+
+WORD = re.compile(r'\w+')
+
+# texinfo commands that only carry markup
+TEXINFO_SKIP = re.compile(r'^\s*(-\*- texinfo -\*-|@(c|end|deftypefnx?|'
+                          r'group|example|smallexample|cindex|tex|'
+                          r'iftex|ifnottex|ifhtml|html|verbatim)\b)')
+TEXINFO_CMD = re.compile(r'@\w+\{([^{}]*)\}')
+
+
+def plain_text(doc):
+    """Strip the texinfo markup from a help text"""
+    lines = [line for line in doc.splitlines()
+             if not TEXINFO_SKIP.match(line)]
+    doc = '\n'.join(lines)
+    while True:
+        new = TEXINFO_CMD.sub(r'\1', doc)
+        if new == doc:
+            break
+        doc = new
+    return doc.replace('@@', '@').strip()
+
+
+def summary(doc):
+    """First sentence of a help text"""
+    para = doc.strip().split('\n\n')[0]
+    para = ' '.join(para.split())
+    return re.split(r'(?<=\.)\s', para)[0]
+
+
+def read_help(path):
+    """Read the help text of an m-file, the first comment block that is
+    not a copyright notice"""
+    try:
+        with open(path, 'rb') as fid:
+            text = fid.read().decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return ''
+    block = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(('%', '#')):
+            line = line.lstrip('%#')
+            block.append(line[1:] if line.startswith(' ') else line)
+        elif block:
+            if block[0].strip().startswith('Copyright'):
+                block = []
+            else:
+                break
+        elif line and not line.startswith('function'):
+            break
+    return plain_text('\n'.join(block))
+
+
+def read_docstrings(path):
+    """Read Octave's built-in docstrings file"""
+    functions = {}
+    if not path:
+        return functions
+    try:
+        with open(path, 'rb') as fid:
+            text = fid.read().decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return functions
+    for entry in text.split('\x1f')[1:]:
+        name, _, doc = entry.partition('\n')
+        if name.strip():
+            functions[name.strip()] = plain_text(doc)
+    return functions
+
+
+def scan_dir(dirname):
+    """Find the functions in a path directory, with their help text"""
+    functions = {}
+    try:
+        files = sorted(os.listdir(dirname))
+    except OSError:
+        return functions
+    for fname in files:
+        name, ext = os.path.splitext(fname)
+        if ext == '.m':
+            functions[name] = read_help(os.path.join(dirname, fname))
+        elif ext in ('.oct', '.mex') and not name in functions:
+            functions[name] = ''
+    return functions
+
+
+def _read_json(path):
+    if not path:
+        return {}
+    try:
+        with open(path) as fid:
+            return json.load(fid)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    """Replace a JSON file atomically"""
+    if not path:
+        return
+    try:
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        fid, temp = tempfile.mkstemp(dir=dirname, suffix='.json')
+        with os.fdopen(fid, 'w') as fid:
+            json.dump(data, fid)
+        os.rename(temp, path)
+    except (IOError, OSError):  # pragma: no cover
+        pass
+
+
+def path_state(cwd, dirs):
+    """
+    Get a key for the function lookup state of a session.
+
+    Parameters
+    ==========
+    cwd : str
+        Working directory.
+    dirs : list of str
+        Directories on the path, in order.
+
+    Returns
+    =======
+    out : str
+        Hash of the working directory, the path and the modification time
+        of each directory, which changes when a file is added or removed.
+
+    """
+    dirs = [cwd] + list(dirs)
+    text = json.dumps([dirs, [mtime(dirname) for dirname in dirs]])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def mtime(path):
+    """Modification time of a file, or None if it cannot be read"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
@@ -8,6 +8,13 @@ PY3 = sys.version[0] == '3'
 if not PY2:  # pragma : no cover
     unicode = str
     long = int
+    import queue
+    try:
+        from collections.abc import Mapping
+    except ImportError:  # Python 3.2
+        from collections import Mapping
 else:  # pragma : no cover
     unicode = unicode
     long = long
+    import Queue as queue
+    from collections import Mapping
@@ -50,7 +50,7 @@ def demo(delay=2, interactive=True):
     oc.put('y', y)
     print(oc.get('y'))
     from oct2py import Struct
-    y = Struct()
+    y = Struct.auto()
     y.b = 'spam'
     y.c.d = 'eggs'
     print(y.c['d'])
@@ -0,0 +1,154 @@
+"""
+.. module:: executor
+   :synopsis: A concurrent.futures Executor backed by Octave sessions.
+              Requires concurrent.futures (Python 3.2+ or the futures
+              backport).
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import threading
+from concurrent.futures import Executor, Future
+from .session import Oct2Py
+from .utils import Oct2PyError
+from .compat import queue
+
+
+class Oct2PyExecutor(Executor):
+    """Executor that runs work on a set of Octave sessions.
+
+    Each worker thread owns one `Oct2Py` session, with its own Octave
+    process and temporary files, so nothing is shared between calls running
+    at the same time.  `submit` takes either the name of an Octave function,
+    which is called on the worker's session, or a Python callable, which
+    runs on the worker thread and can reach that session through
+    `session`.  Queued work can be cancelled until a worker picks it up.
+
+    Keyword arguments other than `max_workers` are passed to each `Oct2Py`.
+
+    Examples
+    --------
+    >>> from oct2py.executor import Oct2PyExecutor
+    >>> with Oct2PyExecutor(2) as executor:
+    ...     future = executor.submit('ones', 1, 2)
+    ...     print(future.result())
+    [[ 1.  1.]]
+
+    """
+    def __init__(self, max_workers=None, **kwargs):
+        if max_workers is None:
+            import multiprocessing
+            max_workers = multiprocessing.cpu_count()
+        if max_workers < 1:
+            raise ValueError('max_workers must be greater than 0')
+        self._tasks = queue.Queue()
+        self._local = threading.local()
+        self._shutdown = False
+        self._shutdown_lock = threading.Lock()
+        self._threads = []
+        for i in range(max_workers):
+            thread = threading.Thread(target=self._work, args=(kwargs,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def session(self):
+        """The `Oct2Py` session of the current worker thread
+
+        Raises
+        ------
+        Oct2PyError
+            If called outside of a worker thread.
+
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            raise Oct2PyError('Not running in an Oct2PyExecutor worker')
+        return session
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule an Octave call or a callable.
+
+        Parameters
+        ----------
+        fn : str or callable
+            Octave function name, called with `Oct2Py.call` (`nout` is 1
+            unless given), or a callable to run on a worker thread.
+        args, kwargs
+            Arguments for the call.
+
+        Returns
+        -------
+        out : concurrent.futures.Future
+            Future for the result.
+
+        """
+        with self._shutdown_lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after '
+                                   'shutdown')
+            future = Future()
+            self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """
+        Stop accepting work and close the sessions once the queue is done.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Wait for the workers to finish.
+        cancel_futures : bool, optional
+            Cancel the work that has not started yet.
+
+        """
+        with self._shutdown_lock:
+            if not self._shutdown:
+                self._shutdown = True
+                if cancel_futures:
+                    while True:
+                        try:
+                            task = self._tasks.get_nowait()
+                        except queue.Empty:
+                            break
+                        task[0].cancel()
+                for thread in self._threads:
+                    self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self, kwargs):
+        """Worker loop, owning one Octave session"""
+        try:
+            session = Oct2Py(**kwargs)
+            error = None
+        except Exception as err:
+            session, error = None, err
+        self._local.session = session
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            future, fn, args, fn_kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            try:
+                if callable(fn):
+                    result = fn(*args, **fn_kwargs)
+                else:
+                    fn_kwargs = dict(fn_kwargs)
+                    fn_kwargs.setdefault('nout', 1)
+                    result = session.call(fn, *args, **fn_kwargs)
+            except BaseException as err:
+                future.set_exception(err)
+            else:
+                future.set_result(result)
+        if session is not None:
+            session.close()
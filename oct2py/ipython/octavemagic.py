@@ -121,6 +121,25 @@ class OctaveMagics(Magics):
         svg.setAttribute('height', '%dpx' % height)
         return svg.toxml()
 
+    def _push(self, names):
+        """
+        Pull variables from Octave into the user namespace.
+
+        All the variables are fetched with a single `get`.
+
+        Parameters
+        ----------
+        names : list of str
+            Names of the variables.
+
+        """
+        if not names:
+            return
+        values = self._oct.get(names)
+        if len(names) == 1:
+            values = (values,)
+        self.shell.push(dict(zip(names, values)))
+
 
     @skip_doctest
     @line_magic
@@ -171,10 +190,9 @@ class OctaveMagics(Magics):
             Out[21]: 'hello'
 
         '''
-        outputs = line.split(' ')
-        for output in outputs:
-            output = unicode_to_str(output)
-            self.shell.push({output: self._oct.get(output)})
+        outputs = [unicode_to_str(output) for output in line.split(' ')
+                   if output]
+        self._push(outputs)
 
     @skip_doctest
     @magic_arguments()
@@ -357,9 +375,8 @@ class OctaveMagics(Magics):
             display_data.append((key, {plot_mime_type: image}))
 
         if args.output:
-            for output in ','.join(args.output).split(','):
-                output = unicode_to_str(output)
-                self.shell.push({output: self._oct.get(output)})
+            self._push([unicode_to_str(output) for output in
+                        ','.join(args.output).split(',')])
 
         for source, data in display_data:
             self._publish_display_data(source, data)
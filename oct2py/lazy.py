@@ -0,0 +1,196 @@
+"""
+.. module:: lazy
+   :synopsis: Record chained Octave calls and run them in one command.
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import re
+from .refs import OctaveRef
+from .utils import get_nout, Oct2PyError
+
+
+class Lazy(object):
+    """Record Octave calls and run them later in a single command.
+
+    Calls made through a recorder return `LazyValue` placeholders, which
+    may be passed to further calls.  Computing a value sends all the
+    inputs in one load, every recorded call it depends on, and one save,
+    as a single command.  Intermediate results never leave Octave.
+
+    Created by `Oct2Py.lazy`.
+
+    """
+    def __init__(self, session):
+        self.session = session
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def call(self, func, *inputs, **kwargs):
+        """
+        Record a call to an Octave function.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        inputs : array_like
+            Values, `LazyValue` placeholders or `OctaveRef` handles.
+        nout : int, optional
+            Number of output arguments, set automatically from the
+            number of return values requested.
+
+        Returns
+        -------
+        out : LazyValue or tuple
+            Placeholder(s) for the result(s).
+
+        """
+        nout = max(kwargs.get('nout', get_nout()), 1)
+        for arg in inputs:
+            if isinstance(arg, LazyValue) and arg.node.lazy is not self:
+                raise Oct2PyError('{0} belongs to another recorder'
+                                  .format(arg))
+        self._count += 1
+        node = _Node(self, self.session._resolve_func(func), inputs, nout,
+                     self._count)
+        values = tuple(LazyValue(node, i) for i in range(nout))
+        if nout > 1:
+            return values
+        return values[0]
+
+    def compute(self, *values, **kwargs):
+        """
+        Run the recorded calls needed for some values in one command.
+
+        Parameters
+        ----------
+        values : LazyValue
+            Placeholders to compute.
+        verbose : bool, optional
+            Log Octave output at info level.
+        resident : bool, optional
+            Keep the results in the session and return `OctaveRef`
+            handles instead.
+
+        Returns
+        -------
+        out : object or tuple
+            Value(s) returned by Octave.
+
+        """
+        verbose = kwargs.get('verbose', False)
+        resident = kwargs.get('resident', False)
+        from .session import _call_line
+        session = self.session
+        # order the calls so that every input is computed before use
+        nodes = []
+        inputs = []
+        # position of each input value, by id
+        positions = {}
+        seen = set()
+
+        def visit(node):
+            if node.index in seen:
+                return
+            seen.add(node.index)
+            for arg in node.inputs:
+                if isinstance(arg, LazyValue):
+                    visit(arg.node)
+                elif not id(arg) in positions:
+                    positions[id(arg)] = len(inputs)
+                    inputs.append(arg)
+            nodes.append(node)
+
+        for value in values:
+            visit(value.node)
+        for arg in inputs:
+            if isinstance(arg, OctaveRef):
+                arg.check(session)
+
+        load_line = ''
+        if inputs:
+            argin_list, load_line = session._writer.create_file(inputs)
+        lines = [load_line]
+        for node in nodes:
+            args = []
+            for arg in node.inputs:
+                if isinstance(arg, LazyValue):
+                    args.append(arg.name)
+                else:
+                    args.append(argin_list[positions[id(arg)]])
+            lines.append(_call_line(node.func, args, node.names) + ';')
+
+        if resident:
+            argout_list = [session._new_ref_name() for value in values]
+            lines.append('\n'.join('{0} = {1};'.format(name, value.name)
+                                   for (name, value) in zip(argout_list,
+                                                            values)))
+        else:
+            argout_list, save_line = session._reader.setup(
+                len(values), [value.name for value in values])
+            lines.append(save_line)
+        # the intermediate results are not needed any more
+        names = [name for node in nodes for name in node.names]
+        lines.append('clear -v {0}'.format(' '.join(names)))
+
+        session._eval('\n'.join(lines), verbose=verbose)
+        if resident:
+            refs = tuple(OctaveRef(session, name) for name in argout_list)
+            if len(refs) > 1:
+                return refs
+            return refs[0]
+        return session._reader.extract_file(argout_list)
+
+    def __getattr__(self, attr):
+        """Automatically creates a recorder for an Octave function.
+        """
+        if re.search(r'\W', attr) or attr.startswith('_'):
+            raise AttributeError(attr)
+        # print_ -> print
+        if attr[-1] == "_":
+            name = attr[:-1]
+        else:
+            name = attr
+
+        def lazy_command(*args, **kwargs):
+            """ Recorded Octave command """
+            if not 'nout' in kwargs:
+                kwargs['nout'] = get_nout()
+            return self.call(name, *args, **kwargs)
+        lazy_command.__name__ = name
+        return lazy_command
+
+
+class _Node(object):
+    """A recorded call"""
+    def __init__(self, lazy, func, inputs, nout, index):
+        self.lazy = lazy
+        self.func = func
+        self.inputs = inputs
+        self.index = index
+        self.names = ['__oct2py_lazy_{0}_{1}'.format(index, i)
+                      for i in range(nout)]
+
+
+class LazyValue(object):
+    """Placeholder for the result of a recorded call.
+    """
+    def __init__(self, node, position):
+        self.node = node
+        self.name = node.names[position]
+
+    def compute(self, **kwargs):
+        """Run the recorded calls and return the value.
+
+        See `Lazy.compute` for the keyword arguments.
+        """
+        return self.node.lazy.compute(self, **kwargs)
+
+    def __repr__(self):
+        return '<LazyValue {0}(...)>'.format(self.node.func)
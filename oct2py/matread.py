@@ -7,24 +7,45 @@
 
 """
 import os
+from operator import attrgetter
 import numpy as np
-from scipy.io import loadmat
-import scipy
 from .utils import Struct, create_file
+from .bulkio import BulkRead, MIN_SIZE
+
+
+# ways to return a struct array, see `MatRead.setup`
+STRUCT_ARRAYS = ['structs', 'columns', 'records']
+# ways to return a cell array, see `MatRead.extract_file`
+CELL_ARRAYS = ['lists', 'arrays']
+# saved by __oct2py_columns_save__.m, the names of the converted variables
+COLUMNS_VAR = 'oct2py_columns__'
 
 
 class MatRead(object):
     """Read Python values from a MAT file made by Octave.
 
     Strives to preserve both value and type in transit.
+    If `shared_memory` is set, dense numeric arrays of at least `bulk_min`
+    elements bypass the MAT file and are received as raw files in shared
+    memory.
+
+    With `strict` set, logical variables are returned as bool arrays rather
+    than uint8.  Logicals inside cells and structs stay uint8.
 
     """
-    def __init__(self):
+    def __init__(self, shared_memory=False, bulk_min=MIN_SIZE, strict=False):
         """Initialize our output file
         """
         self.out_file = create_file()
+        self.strict = strict
+        if shared_memory:
+            self.bulk = BulkRead(bulk_min)
+        else:
+            self.bulk = None
+        self.counts = dict(mat=0, bulk=0)
 
-    def setup(self, nout, names=None):
+    def setup(self, nout, names=None, struct_array='structs',
+              cell_array='lists'):
         """
         Generate the argout list and the Octave save command.
 
@@ -34,6 +55,18 @@ class MatRead(object):
             Number of output arguments required.
         names : array-like, optional
             Variable names to use.
+        struct_array : str, optional
+            How struct arrays are returned: "structs" gives a `Struct`
+            whose fields are lists.  With "columns" or "records", Octave
+            turns each struct array into columns before saving it, one row
+            vector per field of numeric or logical scalars of a single
+            class and one cell per other field.  The values are then a
+            `Struct` of 1-d arrays, or a numpy structured array.  These are
+            always saved in the MAT file.
+        cell_array : str, optional
+            How cell arrays are returned, see `extract_file`.  Only
+            checked here, so that an unknown value fails before Octave runs
+            anything.
 
         Returns
         -------
@@ -41,6 +74,10 @@ class MatRead(object):
             List of variable names, Octave "save" command line
 
         """
+        if not struct_array in STRUCT_ARRAYS:
+            raise ValueError('Unknown struct_array: {0}'.format(struct_array))
+        if not cell_array in CELL_ARRAYS:
+            raise ValueError('Unknown cell_array: {0}'.format(cell_array))
         argout_list = []
         for i in range(nout):
             if names:
@@ -49,8 +86,14 @@ class MatRead(object):
                 argout_list.append("%s__" % chr(i + 97))
         if not os.path.exists(self.out_file):
             self.out_file = create_file()
-        save_line = 'save "-v6" {} "{}"'.format(self.out_file,
-                                                '" "'.join(argout_list))
+        if struct_array != 'structs':
+            save_line = "__oct2py_columns_save__('{0}', '{1}')".format(
+                self.out_file, "', '".join(argout_list))
+        elif self.bulk:
+            save_line = self.bulk.setup(self.out_file, argout_list)
+        else:
+            save_line = 'save "-v6" {} "{}"'.format(self.out_file,
+                                                    '" "'.join(argout_list))
         return argout_list, save_line
 
     def remove_file(self):
@@ -58,8 +101,11 @@ class MatRead(object):
             os.remove(self.out_file)
         except (OSError, AttributeError):  # pragma: no cover
             pass
+        if self.bulk:
+            self.bulk.remove_file()
 
-    def extract_file(self, argout_list):
+    def extract_file(self, argout_list, struct_array='structs',
+                     cell_array='lists'):
         """
         Extract the variables in argout_list from the M file
 
@@ -67,6 +113,14 @@ class MatRead(object):
         ----------
         argout_list : array-like
             List of variables to extract from the file
+        struct_array : str, optional
+            How struct arrays are returned, as given to `setup`.
+        cell_array : str, optional
+            How cell arrays are returned: "lists" gives a list per row.
+            With "arrays", a row or column cell of strings, or of numeric
+            arrays of one type and shape, is returned as one array with a
+            row per element (see `cell_to_array`), and other cells as
+            lists.
 
         Returns
         -------
@@ -74,17 +128,55 @@ class MatRead(object):
             Variable or tuple of variables extracted.
 
         """
-        data = loadmat(self.out_file)
+        data = None
+        columns = ()
+        logicals = ()
+        if struct_array != 'structs':
+            from scipy.io import loadmat
+            data = loadmat(self.out_file)
+            columns = [str(name[0]) for name in data[COLUMNS_VAR].ravel()]
+            logicals = self._logicals()
         outputs = []
         for arg in argout_list:
-            val = data[arg]
-            val = get_data(val)
+            val = None
+            # raw files are only written by the bulk save of `setup`
+            if self.bulk and struct_array == 'structs':
+                val = self.bulk.read(arg)
+            if val is None:
+                if data is None:
+                    # scipy is slow to import, wait until it is needed
+                    from scipy.io import loadmat
+                    data = loadmat(self.out_file)
+                    logicals = self._logicals()
+                val = data[arg]
+                if arg in logicals:
+                    val = val.view(np.bool_)
+                self.counts['mat'] += 1
+            else:
+                self.counts['bulk'] += 1
+            stacked = None
+            if cell_array == 'arrays':
+                stacked = cell_to_array(val)
+            if arg in columns:
+                val = get_columns(val, struct_array == 'records')
+            elif stacked is not None:
+                val = stacked
+            else:
+                val = get_data(val)
             outputs.append(val)
         if len(outputs) > 1:
             return tuple(outputs)
         else:
             return outputs[0]
 
+    def _logicals(self):
+        """Names of the logical variables in the MAT file, in strict mode"""
+        if not self.strict:
+            return ()
+        from scipy.io import whosmat
+        return set(name for (name, shape, kind) in whosmat(self.out_file)
+                   if kind == 'logical')
+
 
 def get_data(val):
     '''Extract the data from the incoming value
@@ -116,6 +208,13 @@ def get_data(val):
             try:
                 return val.astype(val[0][0].dtype)
             except ValueError:
+                items = convert_cells(val.ravel().tolist())
+                if items is not None:
+                    if val.shape[0] == 1 or val.shape[1] == 1:
+                        return items
+                    cols = val.shape[1]
+                    return [items[i:i + cols]
+                            for i in range(0, len(items), cols)]
                 # dig into the cell type
                 for row in range(val.shape[0]):
                     for i in range(val[row].size):
@@ -125,11 +224,14 @@ def get_data(val):
                             else:
                                 val[row][i] = val[row][i][0]
         else:
-            val = np.array([get_data(val[i])
-                            for i in range(val.size)])
+            items = val.tolist()
+            val = stack_cells(items)
+            if val is None:
+                val = np.array([get_data(item) for item in items])
         if len(val.shape) == 1 or val.shape[0] == 1 or val.shape[1] == 1:
             val = val.flatten()
         val = val.tolist()
+        import scipy.sparse
         if len(val) == 1 and isinstance(val[0],
                                         scipy.sparse.csc.csc_matrix):
             val = val[0]
@@ -137,3 +239,193 @@ def get_data(val):
         if hasattr(val, 'flatten'):
             val = val.flatten()[0]
     return val
+
+
+def get_columns(val, records=False):
+    """
+    Extract a struct array saved as columns by __oct2py_columns_save__.m
+
+    Parameters
+    ==========
+    val : ndarray
+        The scalar struct of columns.
+    records : bool, optional
+        Return a structured array instead of a `Struct`.
+
+    Returns
+    =======
+    out : Struct or ndarray
+        A `Struct` of 1-d arrays, one per field, or a structured array with
+        one record per element.
+
+    """
+    data = Struct()
+    names = val.dtype.names or ()
+    for key in names:
+        column = val[key].ravel()[0]
+        if column.dtype != object:
+            # a row vector made by Octave
+            data[key] = column.ravel()
+            continue
+        items = column.ravel().tolist()
+        column = stack_cells(items)
+        if column is None:
+            column = np.empty(len(items), dtype=object)
+            for (i, item) in enumerate(items):
+                column[i] = get_data(item)
+        # one row per element, without the singleton dimensions
+        shape = tuple(dim for dim in column.shape[1:] if dim != 1)
+        data[key] = column.reshape((len(items),) + shape)
+    if not records:
+        return data
+    fields = []
+    for key in names:
+        if data[key].ndim > 1:
+            fields.append((str(key), data[key].dtype, data[key].shape[1:]))
+        else:
+            fields.append((str(key), data[key].dtype))
+    out = np.empty(len(data[names[0]]) if names else 0, dtype=fields)
+    for key in names:
+        out[key] = data[key]
+    return out
+
+
+def _cell_type(items):
+    """
+    Get the common type of the elements of a cell.
+
+    Returns
+    =======
+    out : tuple (dtype, tuple) or None
+        The dtype and shape shared by all the elements, or None if they
+        differ.  For strings of different lengths, the dtype has no
+        length.
+
+    """
+    if not items:
+        return None
+    try:
+        dtypes = set(map(attrgetter('dtype'), items))
+    except AttributeError:
+        return None
+    # strings of different lengths share a type
+    if len(set(dtype.num for dtype in dtypes)) != 1:
+        return None
+    shapes = set(map(attrgetter('shape'), items))
+    if len(shapes) != 1:
+        return None
+    dtype = items[0].dtype
+    if len(dtypes) > 1:
+        dtype = np.dtype(dtype.char)
+    return dtype, shapes.pop()
+
+
+def _stack(items, dtype, shape):
+    """Stack numeric arrays of the same type and shape into one array"""
+    if len([dim for dim in shape if dim != 1]) <= 1:
+        # vectors have the same layout in either order, copy the bytes
+        try:
+            data = bytearray().join(items)
+        except TypeError:  # pragma: no cover
+            pass
+        else:
+            return np.frombuffer(data, dtype).reshape((len(items),) + shape)
+    return np.array(items)
+
+
+def convert_cells(items):
+    """
+    Convert the elements of a 2-d cell array in bulk.
+
+    Handles cells of strings, and cells of numeric arrays that all have the
+    same type and shape.  The values are the same as converting the
+    elements one by one: strings, and arrays without their singleton
+    dimensions, which are views of a single stacked array.
+
+    Parameters
+    ==========
+    items : list
+        Elements of the cell.
+
+    Returns
+    =======
+    out : list or None
+        Converted elements, or None if the cell must be converted one
+        element at a time.
+
+    """
+    cell_type = _cell_type(items)
+    if cell_type is None:
+        return None
+    dtype, shape = cell_type
+    if dtype.kind == 'U' and shape == (1,):
+        return list(map(np.ndarray.item, items))
+    if dtype.kind in 'biufc' and np.prod(shape) > 1:
+        squeezed = tuple(dim for dim in shape if dim != 1)
+        val = _stack(items, dtype, shape)
+        return list(val.reshape((len(items),) + squeezed))
+    return None
+
+
+def cell_to_array(val):
+    """
+    Stack a row or column cell into one array.
+
+    Parameters
+    ==========
+    val : ndarray
+        Cell array as read from the MAT file.
+
+    Returns
+    =======
+    out : ndarray or None
+        For a cell of strings, an array of strings.  For a cell of numeric
+        arrays of one type and shape, an array with a row per element and
+        the singleton dimensions of the elements dropped, so row i is the
+        value element i has as a list item.  None for other values,
+        including cells of scalars.
+
+    """
+    if (val.dtype != object or val.ndim != 2 or min(val.shape) != 1
+            or val.size < 2):
+        return None
+    items = val.ravel().tolist()
+    stacked = stack_cells(items)
+    # cells of scalars are already an array from `get_data`
+    if stacked is None or stacked.ndim == 1 and stacked.dtype.kind != 'U':
+        return None
+    if stacked.ndim > 1:
+        squeezed = tuple(dim for dim in stacked.shape[1:] if dim != 1)
+        stacked = stacked.reshape((len(items),) + squeezed)
+    return stacked
+
+
+def stack_cells(items):
+    """
+    Stack the elements of a 1-d cell array, such as a struct array field.
+
+    Handles cells of strings, and cells of numeric arrays that all have the
+    same type and shape, with the same result as converting the elements
+    one by one and joining them.
+
+    Returns
+    =======
+    out : ndarray or None
+        Stacked array, or None if the elements must be converted one by one.
+
+    """
+    cell_type = _cell_type(items)
+    if cell_type is None:
+        return None
+    dtype, shape = cell_type
+    if dtype.kind == 'U' and shape == (1,):
+        if dtype.itemsize:
+            # strings of one length, copy the bytes
+            return np.frombuffer(bytearray().join(items), dtype)
+        return np.concatenate(items)
+    if dtype.kind in 'biufc':
+        val = _stack(items, dtype, shape)
+        if np.prod(shape) == 1:
+            val = val.reshape(len(items))
+        return val
+    return None
@@ -8,26 +8,52 @@
 """
 import sys
 import os
-from scipy.io import savemat
+import re
 import numpy as np
-from scipy.sparse import csr_matrix, csc_matrix
 from .utils import Oct2PyError, create_file
-from .compat import unicode
+from .compat import unicode, long
+from .bulkio import BulkWrite, MIN_SIZE
+from .refs import OctaveRef
+
+
+# longest literal written straight into the command text
+INLINE_MAX = 64
+# strings we can safely quote for Octave
+PRINTABLE = re.compile(r'^[ -~]*$')
 
 
 class MatWrite(object):
     """Write Python values into a MAT file for Octave.
 
     Strives to preserve both value and type in transit.
+    Each value takes the cheapest path available: scalars and short
+    strings whose literal fits in `inline_max` characters are written
+    straight into the command text, dense numeric arrays of at least
+    `bulk_min` elements go through shared memory if `shared_memory` is set,
+    and everything else goes through the MAT file.  An `OctaveRef` is
+    passed by name, since its value is already in the session.
+
+    With `strict` set, bools are sent as logicals and complex arrays are
+    kept complex in Octave by a call to ``complex`` after the load, rather
+    than by changing their imaginary part.
     """
-    def __init__(self):
+    def __init__(self, shared_memory=False, inline_max=INLINE_MAX,
+                 bulk_min=MIN_SIZE, strict=False):
         self.in_file = create_file()
+        self.inline_max = inline_max
+        self.strict = strict
+        if shared_memory:
+            self.bulk = BulkWrite(bulk_min)
+        else:
+            self.bulk = None
+        self.counts = dict(inline=0, mat=0, bulk=0, resident=0)
 
     def create_file(self, inputs, names=None):
         """
         Create a MAT file, loading the input variables.
 
         If names are given, use those, otherwise use dummies.
+        Dummies for values sent inline are replaced by the literal itself.
 
         Parameters
         ==========
@@ -45,32 +71,71 @@ class MatWrite(object):
 
         """
         # create a dummy list of var names ("A", "B", "C" ...)
-        # use ascii char codes so we can increment
+        # use ascii char codes so we can increment, and number the
+        # letters once we run out ("A1", "B1", ...)
         argin_list = []
-        ascii_code = 65
+        mat_list = []
+        lines = []
         data = {}
-        for var in inputs:
+        for (i, var) in enumerate(inputs):
             if names:
-                argin_list.append(names.pop(0))
+                name = names.pop(0)
+                dummy = False
             else:
-                argin_list.append("%s__" % chr(ascii_code))
+                name = "%s%s__" % (chr(65 + i % 26), i // 26 or '')
+                dummy = True
+            argin_list.append(name)
+            # resident values and small values go straight into the command
+            if isinstance(var, OctaveRef):
+                literal = var.name
+                kind = 'resident'
+            else:
+                literal = octave_literal(var, self.inline_max, self.strict)
+                kind = 'inline'
+            if literal is not None:
+                self.counts[kind] += 1
+                if dummy:
+                    argin_list[-1] = literal
+                else:
+                    lines.append('{0} = {1};'.format(name, literal))
+                continue
+            # large numeric arrays skip the MAT file
+            if self.bulk and self.bulk.accepts(var):
+                try:
+                    lines.append(self.bulk.write(name, var))
+                except (IOError, OSError):
+                    # shared memory is full, use the MAT file instead
+                    pass
+                else:
+                    self.counts['bulk'] += 1
+                    continue
+            self.counts['mat'] += 1
+            mat_list.append(name)
             # for structs - recursively add the elements
             try:
                 if isinstance(var, dict):
-                    data[argin_list[-1]] = putvals(var)
+                    data[name] = putvals(var, self.strict)
                 else:
-                    data[argin_list[-1]] = putval(var)
+                    data[name] = putval(var, self.strict)
             except Oct2PyError:
                 raise
-            ascii_code += 1
-        if not os.path.exists(self.in_file):
-            self.in_file = create_file()
-        try:
-            savemat(self.in_file, data, appendmat=False, oned_as='row')
-        except KeyError:  # pragma: no cover
-            raise Exception('could not save mat file')
-        load_line = 'load {} "{}"'.format(self.in_file,
-                                          '" "'.join(argin_list))
+            # Octave makes arrays real on load when the imaginary part is 0
+            val = data[name]
+            if (self.strict and isinstance(val, np.ndarray)
+                    and val.dtype.kind == 'c' and not np.any(val.imag)):
+                lines.append('{0} = complex({0});'.format(name))
+        if mat_list:
+            # scipy is slow to import, wait until it is needed
+            from scipy.io import savemat
+            if not os.path.exists(self.in_file):
+                self.in_file = create_file()
+            try:
+                savemat(self.in_file, data, appendmat=False, oned_as='row')
+            except KeyError:  # pragma: no cover
+                raise Exception('could not save mat file')
+            lines.insert(0, 'load {} "{}"'.format(self.in_file,
+                                                  '" "'.join(mat_list)))
+        load_line = '\n'.join(lines)
         return argin_list, load_line
 
     def remove_file(self):
@@ -78,9 +143,11 @@ class MatWrite(object):
             os.remove(self.in_file)
         except (OSError, AttributeError):  # pragma: no cover
             pass
+        if self.bulk:
+            self.bulk.remove_file()
 
 
-def putvals(dict_):
+def putvals(dict_, strict=False):
     """
     Put a nested dict into the MAT file as a struct
 
@@ -88,6 +155,8 @@ def putvals(dict_):
     ==========
     dict_ : dict
         Dictionary of object(s) to store
+    strict : bool, optional
+        Keep the types of the values, see `putval`.
 
     Returns
     =======
@@ -98,13 +167,13 @@ def putvals(dict_):
     data = dict()
     for key in dict_.keys():
         if isinstance(dict_[key], dict):
-            data[key] = putvals(dict_[key])
+            data[key] = putvals(dict_[key], strict)
         else:
-            data[key] = putval(dict_[key])
+            data[key] = putval(dict_[key], strict)
     return data
 
 
-def putval(data):
+def putval(data, strict=False):
     """
     Convert data into a state suitable for transfer.
 
@@ -112,6 +181,9 @@ def putval(data):
     ==========
     data : object
         Value to write to file.
+    strict : bool, optional
+        Keep bools and complex values with no imaginary part as they are,
+        instead of sending them as int8 and with an imaginary part of 1e-9.
 
     Returns
     =======
@@ -125,6 +197,7 @@ def putval(data):
     Currently the following types supported: float96, complex192, void
 
     """
+    from scipy.sparse import csr_matrix, csc_matrix
     if data is None:
         data = np.NaN
     if isinstance(data, set):
@@ -144,16 +217,18 @@ def putval(data):
                     cell[0] = el
                     out.append(cell)
                 elif isinstance(el, (csr_matrix, csc_matrix)):
-                    out.append(el.astype(np.float64))
+                    out.append(sparse_double(el))
                 else:
                     out.append(el)
             return out
     if isinstance(data, (str, unicode)):
         return data
     if isinstance(data, (csr_matrix, csc_matrix)):
-        return data.astype(np.float64)
+        return sparse_double(data)
+    # arrays are passed through without a copy, keeping their memory
+    # layout: savemat writes them in Fortran order straight from the buffer
     try:
-        data = np.array(data)
+        data = np.asarray(data)
     except ValueError as err:  # pragma: no cover
         data = np.array(data, dtype=object)
     dstr = data.dtype.str
@@ -163,13 +238,15 @@ def putval(data):
         raise Oct2PyError('Datatype not supported: {0}'.format(data.dtype))
     elif 'V' in dstr:
         raise Oct2PyError('Datatype not supported: {0}'.format(data.dtype))
-    elif dstr == '|b1':
-        data = data.astype(np.int8)
+    elif dstr == '|b1' and not strict:
+        data = data.view(np.int8)
     elif dstr == '<m8[us]' or dstr == '<M8[us]':
-        data = data.astype(np.uint64)
+        data = data.view(np.uint64)
     elif '|S' in dstr or '<U' in dstr:
         data = data.astype(np.object)
-    elif '<c' in dstr and np.alltrue(data.imag == 0):
+    elif '<c' in dstr and not strict and not np.any(data.imag):
+        # keep it complex in Octave, without touching the caller's array
+        data = data.copy(order='K')
         data.imag = 1e-9
     if data.dtype.name in ['float128', 'complex256']:
         raise Oct2PyError('Datatype not supported: {0}'.format(data.dtype))
@@ -178,6 +255,13 @@ def putval(data):
     return data
 
 
+def sparse_double(data):
+    """Get a sparse matrix as doubles, copying only if needed"""
+    if data.dtype == np.float64:
+        return data
+    return data.astype(np.float64)
+
+
 def str_in_list(list_):
     '''See if there are any strings in the given list
     '''
@@ -187,3 +271,72 @@ def str_in_list(list_):
         elif isinstance(item, list):
             if str_in_list(item):
                 return True
+
+
+def octave_literal(data, max_chars=INLINE_MAX, strict=False):
+    """
+    Get the Octave literal for a scalar or a short string.
+
+    Parameters
+    ==========
+    data : object
+        Value to convert.
+    max_chars : int
+        Longest literal to return.
+    strict : bool, optional
+        Give bools as logicals.
+
+    Returns
+    =======
+    out : str or None
+        Octave expression for the value, or None if it should be
+        sent in a file.
+
+    Notes
+    =====
+    Types match what the MAT file would give: bools become int8 (logical
+    if `strict`) and integers keep their width.  Integers beyond the range
+    where doubles are exact are left to the MAT file, since Octave parses
+    them as doubles.
+
+    """
+    if data is None:
+        literal = 'NaN'
+    elif isinstance(data, (bool, np.bool_)):
+        if strict:
+            literal = 'true' if data else 'false'
+        else:
+            literal = 'int8({0:d})'.format(bool(data))
+    elif isinstance(data, (str, unicode)):
+        if not PRINTABLE.match(data):
+            return None
+        literal = "'{0}'".format(data.replace("'", "''"))
+    elif isinstance(data, (int, long, float, complex, np.number)):
+        val = np.asarray(data)
+        dtype = val.dtype.name
+        if dtype in ['float64', 'float32']:
+            literal = float_literal(val)
+        elif dtype in ['complex128', 'complex64']:
+            literal = 'complex({0}, {1})'.format(float_literal(val.real),
+                                                 float_literal(val.imag))
+        elif val.dtype.kind in 'iu' and abs(int(val)) <= 2 ** 53:
+            literal = '{0}({1})'.format(dtype, int(val))
+        else:
+            return None
+        if dtype in ['float32', 'complex64']:
+            literal = 'single({0})'.format(literal)
+    else:
+        return None
+    if len(literal) > max_chars:
+        return None
+    return literal
+
+
+def float_literal(val):
+    """Get an exact Octave literal for a float"""
+    val = float(val)
+    if np.isnan(val):
+        return 'NaN'
+    elif np.isinf(val):
+        return '-Inf' if val < 0 else 'Inf'
+    return repr(val)
@@ -0,0 +1,331 @@
+"""
+.. module:: pool
+   :synopsis: Run independent Octave calls on a pool of sessions.
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import functools
+import threading
+import numpy as np
+from .session import Oct2Py
+from .utils import Future, Oct2PyError
+from .compat import queue
+
+
+# element-wise reductions available by name in `Oct2PyPool.map_array`
+REDUCTIONS = dict(sum=np.add, prod=np.multiply, max=np.maximum,
+                  min=np.minimum)
+
+
+class Oct2PyPool(object):
+    """Spread independent Octave calls over several Octave sessions.
+
+    Each session runs in its own Octave process with its own temporary
+    files, and is driven by a worker thread that takes calls from a
+    shared queue.  All the sessions are started up front, so the first
+    calls do not pay for the start up.
+
+    Keyword arguments other than `processes` are passed to each `Oct2Py`.
+
+    Examples
+    --------
+    >>> from oct2py import Oct2PyPool
+    >>> with Oct2PyPool(2) as pool:
+    ...     print(pool.map('numel', [[1, 2], [1, 2, 3]]))
+    [2.0, 3.0]
+
+    """
+    def __init__(self, processes=None, **kwargs):
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        if processes < 1:
+            raise ValueError('Number of processes must be at least 1')
+        self._tasks = queue.Queue()
+        self._workers = [_Worker(self._tasks, kwargs)
+                         for i in range(processes)]
+        for worker in self._workers:
+            worker.start()
+        errors = [worker.wait_ready() for worker in self._workers]
+        errors = [err for err in errors if err is not None]
+        if errors:
+            self.close()
+            raise errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._workers)
+
+    def apply_async(self, func, args=(), kwds=None):
+        """
+        Queue a call to an Octave function.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        args : tuple, optional
+            Variables to pass to the function.
+        kwds : dict, optional
+            Keyword arguments for `Oct2Py.call`, such as `nout`.
+            The default `nout` is 1.
+
+        Returns
+        -------
+        out : Future
+            Future for the result of the call.
+
+        """
+        return self._submit(func, args, kwds)
+
+    def map(self, func, iterable, **kwargs):
+        """
+        Call an Octave function once for each value.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        iterable : iterable
+            Values to pass, one per call.
+        kwargs : dict, optional
+            Keyword arguments for `Oct2Py.call`, such as `nout`.
+
+        Returns
+        -------
+        out : list
+            Results, in the order of the inputs.
+
+        Raises
+        ------
+        Oct2PyError
+            For the first input whose call failed.
+
+        """
+        return self.starmap(func, [(item,) for item in iterable], **kwargs)
+
+    def starmap(self, func, iterable, **kwargs):
+        """
+        Call an Octave function once for each tuple of arguments.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        iterable : iterable of tuples
+            Arguments to pass, one tuple per call.
+        kwargs : dict, optional
+            Keyword arguments for `Oct2Py.call`, such as `nout`.
+
+        Returns
+        -------
+        out : list
+            Results, in the order of the inputs.
+
+        Raises
+        ------
+        Oct2PyError
+            For the first input whose call failed.
+
+        """
+        futures = [self._submit(func, args, kwargs) for args in iterable]
+        return [future.result() for future in futures]
+
+    def imap_unordered(self, func, iterable, **kwargs):
+        """
+        Call an Octave function once for each value, yielding the
+        results as they finish.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        iterable : iterable
+            Values to pass, one per call.
+        kwargs : dict, optional
+            Keyword arguments for `Oct2Py.call`, such as `nout`.
+
+        Yields
+        ------
+        out : object
+            Results, in the order they finish.
+
+        """
+        done = queue.Queue()
+        count = 0
+        for item in iterable:
+            self._submit(func, (item,), kwargs, done)
+            count += 1
+        for i in range(count):
+            yield done.get().result()
+
+    def map_array(self, func, arr, axis=None, chunks=None, reduce=None,
+                  **kwargs):
+        """
+        Split an array into chunks and call an Octave function on each.
+
+        The chunks are views of `arr`, sent to the sessions through the
+        normal `call` path.  By default the results are joined back along
+        `axis`, copied once into a preallocated array.
+
+        Parameters
+        ----------
+        func : str
+            Function name to call.
+        arr : array_like
+            Array to split.
+        axis : int, optional
+            Axis to split along, columns by default.  Required for a 1-d
+            `arr`.
+        chunks : int, optional
+            Number of chunks, one per session by default.
+        reduce : str or callable, optional
+            Combine the results instead of joining them.  One of "sum",
+            "prod", "max" or "min" (element-wise), or a function taking
+            two results and returning one, applied in input order.
+        kwargs : dict, optional
+            Keyword arguments for `Oct2Py.call`.
+
+        Returns
+        -------
+        out : ndarray or object
+            The joined or reduced result.
+
+        Raises
+        ------
+        Oct2PyError
+            For the first chunk whose call failed.
+        ValueError
+            If `arr` is a scalar, if `axis` is missing for a 1-d `arr` or
+            out of range, or if the results have no `axis` to be joined
+            along (such as one scalar per chunk), which needs `reduce`.
+
+        Examples
+        --------
+        >>> import numpy as np
+        >>> from oct2py import Oct2PyPool
+        >>> with Oct2PyPool(2) as pool:
+        ...     print(pool.map_array('cumsum', np.ones((2, 4))))
+        ...     print(pool.map_array('sum', np.ones((2, 4)), reduce='sum'))
+        [[ 1.  1.  1.  1.]
+         [ 2.  2.  2.  2.]]
+        [[ 4.  4.]]
+
+        """
+        if isinstance(reduce, str):
+            try:
+                reduce = REDUCTIONS[reduce]
+            except KeyError:
+                raise ValueError('Unknown reduction: {0}'.format(reduce))
+        arr = np.asarray(arr)
+        if arr.ndim == 0:
+            raise ValueError('map_array needs an array with at least one '
+                             'dimension, not a scalar')
+        if axis is None:
+            if arr.ndim == 1:
+                raise ValueError('Pass axis=0 to split a 1-d array')
+            axis = 1
+        if not -arr.ndim <= axis < arr.ndim:
+            raise ValueError('axis {0} is out of range for an array with {1} '
+                             'dimensions'.format(axis, arr.ndim))
+        axis = axis % arr.ndim
+        if chunks is None:
+            chunks = len(self)
+        chunks = max(min(chunks, arr.shape[axis]), 1)
+        futures = [self._submit(func, (chunk,), kwargs)
+                   for chunk in np.array_split(arr, chunks, axis=axis)]
+        if reduce is not None:
+            return functools.reduce(reduce, [f.result() for f in futures])
+        results = []
+        for future in futures:
+            result = np.asarray(future.result())
+            # Octave has no 1-d arrays, drop the leading singletons
+            extra = result.ndim - arr.ndim
+            if extra > 0 and all(dim == 1 for dim in result.shape[:extra]):
+                result = result.reshape(result.shape[extra:])
+            if result.ndim <= axis:
+                raise ValueError('Cannot join results of shape {0} along '
+                                 'axis {1}, pass reduce to combine them'
+                                 .format(result.shape, axis))
+            results.append(result)
+        shape = list(results[0].shape)
+        shape[axis] = sum(result.shape[axis] for result in results)
+        out = np.empty(shape, np.result_type(*results))
+        index = [slice(None)] * len(shape)
+        start = 0
+        for result in results:
+            stop = start + result.shape[axis]
+            index[axis] = slice(start, stop)
+            out[tuple(index)] = result
+            start = stop
+        return out
+
+    def close(self):
+        """Wait for the queued calls, then close all the sessions
+        """
+        for worker in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _submit(self, func, args, kwargs, done=None):
+        if not self._workers:
+            raise Oct2PyError('Pool has been closed')
+        kwargs = dict(kwargs or {})
+        kwargs.setdefault('nout', 1)
+        future = Future()
+        self._tasks.put((func, tuple(args), kwargs, future, done))
+        return future
+
+
+class _Worker(threading.Thread):
+    """Thread that owns one Octave session and runs calls from a queue
+    """
+    def __init__(self, tasks, kwargs):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.tasks = tasks
+        self.kwargs = kwargs
+        self.error = None
+        self._ready = threading.Event()
+
+    def wait_ready(self):
+        """Wait for the session to start, and return the error if it failed
+        """
+        self._ready.wait()
+        return self.error
+
+    def run(self):
+        try:
+            octave = Oct2Py(**self.kwargs)
+        except Exception as err:
+            self.error = err
+            octave = None
+        self._ready.set()
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            func, args, kwargs, future, done = task
+            if octave is None:
+                future.set_exception(self.error)
+            else:
+                try:
+                    future.set_result(octave.call(func, *args, **kwargs))
+                except Exception as err:
+                    msg = '{0} failed for input {1!r}:\n{2}'.format(func,
+                                                                   args, err)
+                    error = Oct2PyError(msg)
+                    error.input = args
+                    future.set_exception(error)
+            if done is not None:
+                done.put(future)
+        if octave is not None:
+            octave.close()
@@ -0,0 +1,89 @@
+"""
+.. module:: refs
+   :synopsis: Handles to values that stay in the Octave session.
+
+.. moduleauthor:: Steven Silvester <steven.silvester@ieee.org>
+
+"""
+import numpy as np
+from .utils import Oct2PyError
+
+
+# prefix for the workspace variables holding resident results
+REF_PREFIX = '__oct2py_ref_'
+
+
+class OctaveRef(object):
+    """Handle to a variable that stays in an Octave session.
+
+    Returned by `Oct2Py.call(..., resident=True)` and `Oct2Py.handle`.
+    A handle can be passed back to `call` (or any dynamic function) without
+    the value leaving Octave.  The value is only transferred by `fetch` or
+    `numpy.asarray`.
+
+    Handles are counted per session, and a resident result is cleared from
+    the Octave workspace once the last handle to it is garbage collected.
+    Handles do not survive a `restart`.
+
+    Examples
+    ========
+    >>> from oct2py import octave
+    >>> x = octave.call('ones', 3, 3, resident=True)
+    >>> y = octave.call('sum', x, resident=True)
+    >>> print(y.fetch())
+    [[ 3.  3.  3.]]
+
+    """
+    def __init__(self, session, name, owned=True):
+        """Register the handle with its session
+
+        Parameters
+        ==========
+        session : Oct2Py
+            Session holding the variable.
+        name : str
+            Name of the variable in the Octave workspace.
+        owned : bool
+            Whether the variable should be cleared with the last handle.
+
+        """
+        self.session = session
+        self.name = name
+        self.owned = owned
+        self._generation = session._generation
+        session._acquire(name)
+
+    def check(self, session):
+        """
+        Make sure the handle can be used with a session.
+
+        Raises
+        ======
+        Oct2PyError
+            If the handle belongs to another session or to a session
+            that has been restarted.
+
+        """
+        if session is not self.session:
+            raise Oct2PyError('{0} belongs to another session'.format(self))
+        if self._generation != session._generation:
+            raise Oct2PyError('{0} did not survive a restart'.format(self))
+
+    def fetch(self, verbose=False):
+        """Transfer the value into Python"""
+        self.check(self.session)
+        return self.session.get(self.name, verbose=verbose)
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.fetch(), dtype)
+
+    def __repr__(self):
+        return '<OctaveRef {0}>'.format(self.name)
+
+    def __del__(self):
+        try:
+            if self._generation == self.session._generation:
+                self.session._release(self.name, self.owned)
+        except Exception:  # pragma: no cover
+            # the session may already be gone at interpreter exit
+            pass
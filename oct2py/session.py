@@ -9,13 +9,72 @@
 import os
 import re
 import atexit
-import doctest
+import keyword
+import select
+import struct
 import subprocess
 import sys
-from .matwrite import MatWrite
+import threading
+import time
+from .matwrite import MatWrite, INLINE_MAX
 from .matread import MatRead
-from .utils import get_nout, Oct2PyError, get_log
-from .compat import unicode
+from .bulkio import MIN_SIZE
+from .refs import OctaveRef, REF_PREFIX
+from .lazy import Lazy
+from .batch import Batch
+from .cache import get_cache, get_index, mtime, path_state, save_caches
+from .utils import get_nout, Oct2PyError, get_log, Struct, Future
+from .compat import unicode, PY2, queue
+
+
+# location of the helper m-files shipped with oct2py
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# status frame sent by __oct2py_frame__.m after each command: the magic
+# bytes, the status, the message length and the path stamp
+FRAME_FORMAT = '=4sIII'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+# printed by __oct2py_frame__.m after the command output
+END_MARKER = b'\x03\x15\x03\n'
+SYNTAX_MSG = b'syntax error'
+SYNTAX_ERROR = -1
+BUFSIZE = 65536
+TRAILING_SPACE = re.compile(r'[ \t\r\f\v]+$', re.M)
+# Octave command line options, by profile name
+PROFILES = dict(
+    # -q is quiet startup, --braindead is Matlab compatibilty mode
+    default=['-q', '--braindead'],
+    # also skip the init and site files, history and the window system
+    fast=['-q', '--braindead', '--norc', '--no-history',
+          '--no-window-system'],
+)
+# sets up the plot renderer, run once in each new session; the figures
+# created by a command are refreshed by __oct2py_refresh__.m
+WARM_UP = """
+    global __oct2py_figures = [];
+    page_screen_output(0);
+
+    function fig_create(src, event)
+      global __oct2py_figures;
+      __oct2py_figures(size(__oct2py_figures) + 1) = src;
+    end
+
+    set(0, 'DefaultFigureCreateFcn', @fig_create);
+"""
+# dummy input names written by MatWrite
+DUMMY = re.compile(r'^[A-Z]\d*__$')
+# run once in each new session without graphics
+HEADLESS_WARM_UP = "page_screen_output(0);"
+# raised by __oct2py_exist__.m, followed by the missing names
+MISSING = re.compile(r'oct2py: variables not found: ([^\r\n]*)')
+# prints the working directory, path and built-in docstrings file for the
+# help index
+INDEX_QUERY = ("disp(pwd); disp(path); try, disp(built_in_docstrings_file()); "
+               "catch, disp(''); end")
+# first command of a new session: the version, then the path
+BOOT_QUERY = ['disp(OCTAVE_VERSION)', INDEX_QUERY]
+# set to a non-empty value to disable the global `oct2py.octave` session
+NO_GLOBAL = 'OCT2PY_NO_GLOBAL'
 
 
 class Oct2Py(object):
@@ -31,19 +90,69 @@ class Oct2Py(object):
     default will be used.  Events will be logged as debug unless verbose is set
     when calling a command, then they will be logged as info.
 
+    Each value is sent by the cheapest means available.  Scalars and short
+    strings whose Octave literal is at most `inline_max` characters are
+    written straight into the command.  If `shared_memory` is set, dense
+    numeric arrays of at least `bulk_min` elements are passed through raw
+    files in shared memory (/dev/shm where available), in both directions.
+    Everything else uses MAT files.  See `stats` for the current settings
+    and how often each path was taken.
+
+    With ``start='background'``, Octave is started and warmed up on a
+    helper thread, and the constructor returns right away.  `ready` is a
+    `Future` that finishes when the session can be used; commands sent
+    before then wait for it.
+
+    With `spares` > 0, that many warmed up Octave processes are kept in
+    reserve.  `restart` swaps one in instead of starting Octave, and a new
+    spare is started in the background.
+
+    The launch profile sets how Octave is started: the `executable`, its
+    command line `args` (a list, or the name of one of the `PROFILES`;
+    "fast" skips the init and site files, history and the window system),
+    extra `env` variables, and the `paths` and `packages` loaded once at
+    launch.  The time spent in each phase of the start is in `stats`.
+
+    With ``graphics=False``, the session is headless: no graphics toolkit
+    or plot renderer is set up.  Either way, commands carry no plotting
+    code; figures are refreshed only after a command that created one.
+
+    With ``strict_dtypes=True``, bools are sent as logicals instead of
+    int8, complex arrays whose imaginary part is zero stay complex without
+    being changed, and logical results come back as bool arrays instead of
+    uint8.  Other numeric types keep their class either way.
+
     """
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, shared_memory=False,
+                 inline_max=INLINE_MAX, bulk_min=MIN_SIZE, start='eager',
+                 spares=0, executable='octave', args='default', env=None,
+                 paths=None, packages=None, graphics=True,
+                 strict_dtypes=False):
         """Start Octave and create our MAT helpers
         """
+        if not start in ['eager', 'background']:
+            raise ValueError('Unknown start mode: {0}'.format(start))
         if not logger is None:
             self.logger = logger
         else:
             self.logger = get_log()
+        self._shared_memory = shared_memory
+        self._inline_max = inline_max
+        self._bulk_min = bulk_min
+        self._strict_dtypes = strict_dtypes
+        self._start = start
+        self._launch = _launch_options(executable, args, env, paths,
+                                       packages, graphics)
+        self._spares = None
+        if spares:
+            self._spares = _Spares(spares, self.logger, self._launch)
+        self._generation = 0
+        self._ref_count = 0
         self.restart()
 
     def __enter__(self):
         '''Return octave object, restart session if necessary'''
-        if not self._session:
+        if not self._session and self.ready.done():
             self.restart()
         return self
 
@@ -54,9 +163,15 @@ class Oct2Py(object):
     def close(self):
         """Closes this octave session and removes temp files
         """
+        if threading.current_thread() is not self._starter:
+            self.ready.exception()
         if self._session:
             self._session.close()
         self._session = None
+        save_caches()
+        if self._spares:
+            self._spares.close()
+            self._spares = None
         self._writer.remove_file()
         self._reader.remove_file()
 
@@ -118,6 +233,26 @@ class Oct2Py(object):
             different value.
         verbose : bool, optional
              Log Octave output at info level.
+        resident : bool, optional
+            Keep the results in the Octave session and return `OctaveRef`
+            handles to them instead of the values.
+        struct_array : str, optional
+            How struct arrays are returned: "structs" (a `Struct` of
+            lists), "columns" (a `Struct` of 1-d arrays) or "records" (a
+            structured array).  See `MatRead.setup`.
+        cell_array : str, optional
+            How cell arrays are returned: "lists", or "arrays" to stack
+            row or column cells of strings or of equal numeric arrays into
+            one array.  See `MatRead.extract_file`.
+        lean : bool, optional
+            Send the call as a single line to the `__oct2py_call__` helper,
+            which loads the inputs, calls the function, saves the outputs
+            and reports the status, so there is much less for Octave to
+            parse.  The function runs inside the helper rather than in the
+            base workspace, so only use it for functions that do not look
+            at their caller.  Calls that need more than the helper offers
+            (no outputs, shared memory, pending clears, no status pipe)
+            are sent as usual.
 
         Returns
         -------
@@ -154,39 +289,43 @@ class Oct2Py(object):
 
         verbose = kwargs.get('verbose', False)
         nout = kwargs.get('nout', get_nout())
-
-        # handle references to script names - and paths to them
-        if func.endswith('.m'):
-            if os.path.dirname(func):
-                self.addpath(os.path.dirname(func))
-                func = os.path.basename(func)
-            func = func[:-2]
+        resident = kwargs.get('resident', False)
+        lean = kwargs.get('lean', False) and nout and not resident
+        struct_array = kwargs.get('struct_array', 'structs')
+        cell_array = kwargs.get('cell_array', 'lists')
+        if resident:
+            nout = max(nout, 1)
+        for arg in inputs:
+            if isinstance(arg, OctaveRef):
+                arg.check(self)
+
+        func = self._resolve_func(func)
 
         # these three lines will form the commands sent to Octave
         # load("-v6", "infile", "invar1", ...)
         # [a, b, c] = foo(A, B, C)
         # save("-v6", "outfile", "outvar1", ...)
-        load_line = call_line = save_line = ''
+        load_line = save_line = ''
+        argin_list = argout_list = []
 
-        if nout:
+        if resident:
+            # results stay in the session under fresh names
+            argout_list = [self._new_ref_name() for i in range(nout)]
+        elif nout:
             # create a dummy list of var names ("a", "b", "c", ...)
             # use ascii char codes so we can increment
-            argout_list, save_line = self._reader.setup(nout)
-            call_line = '[{0}] = '.format(', '.join(argout_list))
+            argout_list, save_line = self._reader.setup(nout, None,
+                                                        struct_array,
+                                                        cell_array)
         if inputs:
             argin_list, load_line = self._writer.create_file(inputs)
-            call_line += '{0}({1})'.format(func, ', '.join(argin_list))
-        elif nout:
-            # call foo() - no arguments
-            call_line += '{0}()'.format(func)
-        else:
-            # run foo
-            call_line += '{0}'.format(func)
-            
-        pre_call = '\nglobal __oct2py_figures = [];\n'
-        post_call = ''        
-        
-        if not nout and 'command' in kwargs and not '__ipy_figures' in func:
+        call_line = _call_line(func, argin_list, argout_list)
+
+        post_call = ''
+
+        fetch_ans = (not nout and 'command' in kwargs and
+                     not '__ipy_figures' in func)
+        if fetch_ans:
             if not call_line.endswith(')'):
                 call_line += '();\n'
             post_call += '''
@@ -197,22 +336,32 @@ class Oct2Py(object):
                   _ = "__no_answer";
                 end
             '''
+            # fetch it in the same command
+            argout_list, save_line = self._reader.setup(1, ['_'])
+
+        lean_line = None
+        if lean and not fetch_ans and struct_array == 'structs':
+            lean_line = self._lean_line(func, argin_list, load_line, nout)
+        if lean_line:
+            resp = self._eval([lean_line], verbose=verbose, wrap=False)
+        else:
+            # create the command and execute in octave
+            cmd = [load_line, call_line, post_call, save_line]
+            resp = self._eval(cmd, verbose=verbose)
         
-        # do not interfere with octavemagic logic
-        if not "DefaultFigureCreateFcn" in call_line:
-            post_call += """
-            for f = __oct2py_figures
-                refresh(f);
-            end"""
-
-        # create the command and execute in octave
-        cmd = [load_line, pre_call, call_line, post_call, save_line]
-        resp = self._eval(cmd, verbose=verbose)
-        
-        if nout:
-            return self._reader.extract_file(argout_list)
+        if resident:
+            refs = tuple(OctaveRef(self, name) for name in argout_list)
+            if len(refs) > 1:
+                return refs
+            return refs[0]
+        elif nout:
+            return self._reader.extract_file(argout_list, struct_array,
+                                             cell_array)
         elif 'command' in kwargs:
-            ans = self.get('_')
+            if fetch_ans:
+                ans = self._reader.extract_file(argout_list)
+            else:
+                ans = self.get('_')
             # Unfortunately, Octave doesn't have a "None" object,
             # so we can't return any NaN outputs
             if isinstance(ans, (str, unicode)) and ans == "__no_answer":
@@ -221,6 +370,90 @@ class Oct2Py(object):
         else:
             return resp
 
+    def lazy(self):
+        """
+        Record calls to run them later in a single command.
+
+        Returns
+        -------
+        out : Lazy
+            Recorder with the same dynamic functions as this session,
+            returning `LazyValue` placeholders.
+
+        Examples
+        --------
+        >>> from oct2py import octave
+        >>> with octave.lazy() as L:
+        ...     y = L.max(L.abs(L.fft([1, 1, 1, 1])))
+        >>> print(y.compute())
+        4.0
+
+        """
+        return Lazy(self)
+
+    def batch(self):
+        """
+        Queue independent calls and run them in a single command.
+
+        Returns
+        -------
+        out : Batch
+            Queue with the same dynamic functions as this session,
+            returning futures.  It is flushed on leaving a ``with`` block.
+
+        Examples
+        --------
+        >>> from oct2py import octave
+        >>> with octave.batch() as b:
+        ...     x = b.ones(1, 2)
+        ...     y = b.call('size', [1, 2, 3])
+        >>> print(x.result(), y.result())
+        (array([[ 1.,  1.]]), array([[ 1.,  3.]]))
+
+        """
+        return Batch(self)
+
+    def _resolve_func(self, func):
+        """Handle references to script names - and paths to them"""
+        if func.endswith('.m'):
+            dirname = os.path.dirname(func)
+            if dirname and not dirname in self._added_paths:
+                self.addpath(dirname)
+                self._added_paths.add(dirname)
+            if dirname:
+                func = os.path.basename(func)
+            func = func[:-2]
+        return func
+
+    def _lean_line(self, func, argin_list, load_line, nout):
+        """Build the single line call to __oct2py_call__.m
+
+        Returns
+        -------
+        out : str or None
+            The command, or None if the call must be sent as usual.
+
+        """
+        if threading.current_thread() is not self._starter:
+            self.ready.result()
+        session = self._session
+        if (not session or session._frame_fd is None or self._reader.bulk
+                or self._pending_clears or self._pending_reloads
+                or '__oct2py_bulk_read__' in load_line or '\n' in load_line):
+            return None
+        # inputs from the MAT file are passed by name, with their positions
+        args = []
+        loaded = []
+        for (i, arg) in enumerate(argin_list):
+            if DUMMY.match(arg):
+                loaded.append(str(i + 1))
+                arg = "'{0}'".format(arg)
+            args.append(arg)
+        infile = self._writer.in_file if loaded else ''
+        return "__oct2py_call__('{0}', {1}, '{2}', '{3}', [{4}]{5})".format(
+            func, nout, infile, self._reader.out_file, ' '.join(loaded),
+            ''.join(', ' + arg for arg in args))
+
     def put(self, names, var, verbose=False):
         """
         Put a variable into the Octave session.
@@ -253,7 +486,8 @@ class Oct2Py(object):
         _, load_line = self._writer.create_file(var, names)
         self._eval(load_line, verbose=verbose)
 
-    def get(self, var, verbose=False):
+    def get(self, var, verbose=False, struct_array='structs',
+            cell_array='lists'):
         """
         Retrieve a value from the Octave session.
 
@@ -261,6 +495,14 @@ class Oct2Py(object):
         ----------
         var : str
             Name of the variable to retrieve.
+        struct_array : str, optional
+            How struct arrays are returned: "structs" (a `Struct` of
+            lists), "columns" (a `Struct` of 1-d arrays) or "records" (a
+            structured array).  See `MatRead.setup`.
+        cell_array : str, optional
+            How cell arrays are returned: "lists", or "arrays" to stack
+            row or column cells of strings or of equal numeric arrays into
+            one array.  See `MatRead.extract_file`.
 
         Returns
         -------
@@ -269,7 +511,8 @@ class Oct2Py(object):
 
         Raises:
           Oct2PyError
-            If the variable does not exist in the Octave session.
+            If any of the variables do not exist in the Octave session.
+            All the missing names are in its `missing` attribute.
 
         Examples:
           >>> from oct2py import octave
@@ -284,37 +527,172 @@ class Oct2Py(object):
         """
         if isinstance(var, str):
             var = [var]
-        # make sure the variable(s) exist
-        for variable in var:
-            if self._eval("exist {0}".format(variable),
-                          verbose=False) == 'ans = 0':
-                raise Oct2PyError('{0} does not exist'.format(variable))
-        argout_list, save_line = self._reader.setup(len(var), var)
-        self._eval(save_line, verbose=verbose)
-        return self._reader.extract_file(argout_list)
+        # make sure the variable(s) exist in the same command as the save
+        argout_list, save_line = self._reader.setup(len(var), list(var),
+                                                    struct_array, cell_array)
+        try:
+            self._eval([exist_line(argout_list), save_line], verbose=verbose)
+        except Oct2PyError as err:
+            raise missing_error(err)
+        return self._reader.extract_file(argout_list, struct_array,
+                                         cell_array)
+
+    def handle(self, name):
+        """
+        Get a handle to an existing variable in the Octave session.
+
+        The handle can be passed to `call` without transferring the value.
+        The variable is not cleared when the handle is released.
+
+        Parameters
+        ----------
+        name : str
+            Name of the variable.
+
+        Returns
+        -------
+        out : OctaveRef
+            Handle to the variable.
+
+        """
+        return OctaveRef(self, name, owned=False)
+
+    def _new_ref_name(self):
+        """Make a unique workspace name for a resident value"""
+        self._ref_count += 1
+        return '{0}{1}'.format(REF_PREFIX, self._ref_count)
+
+    def _acquire(self, name):
+        """Count a new handle to a workspace variable"""
+        self._refs[name] = self._refs.get(name, 0) + 1
+
+    def _release(self, name, owned=True):
+        """Drop a handle, clearing the variable with the last owned one
+
+        The clear is sent with the next command, since handles may be
+        released at any time, e.g. by the garbage collector.
+
+        """
+        self._refs[name] -= 1
+        if not self._refs[name]:
+            del self._refs[name]
+            if owned:
+                self._pending_clears.append(name)
 
     def lookfor(self, string, verbose=False):
         """
-        Call the Octave "lookfor" command.
+        Search the names and help text of the functions on the path.
 
-        Uses with the "-all" switch to search within help strings.
+        Answered from the help index, like `search`, instead of the Octave
+        "lookfor -all" command, which reads every help text each time.
 
         Parameters
         ----------
         string : str
-            Search string for the lookfor command.
+            Words to look for.
         verbose : bool, optional
-             Log Octave output at info level.
+             Log the results at info level.
 
         Returns
         -------
         out : str
-            Output from the Octave lookfor command.
+            One line per function, with the first sentence of its help.
+
+        """
+        results = self.search(string)
+        width = max([len(name) for name, _ in results] or [0])
+        text = '\n'.join(['{0:<{1}}  {2}'.format(name, width, doc)
+                          for name, doc in results])
+        if verbose:
+            self.logger.info(text)
+        else:
+            self.logger.debug(text)
+        return text
 
+    def search(self, string):
         """
-        return self.run('lookfor -all {0}'.format(string), verbose=verbose)
+        Search the names and help text of the functions on the path.
+
+        The first search builds an index of the built-in functions and of
+        the files in each path directory, which is saved with the function
+        cache.  After that, only the directories that changed are scanned
+        again, and a search costs a single command to read the path.
+
+        Parameters
+        ----------
+        string : str
+            Words to look for, matched as substrings, case insensitively.
+            Functions must match every word.
+
+        Returns
+        -------
+        out : list of tuple
+            (name, summary) pairs, with the functions whose name matches
+            the first word listed first.
+
+        Examples
+        --------
+        >>> from oct2py import octave
+        >>> 'cosd' in dict(octave.search('cosine'))
+        True
 
-    def _eval(self, cmds, verbose=True, log=True):
+        """
+        return self._help_index().search(string)
+
+    def _help_index(self):
+        """Get the help index, updated for the current path"""
+        cwd, dirs, docstrings = self._search_path()
+        index = get_index(self._session_version())
+        index.update(dirs, docstrings)
+        return index
+
+    def _search_path(self):
+        """
+        Get the working directory, path and built-in docstrings file.
+
+        They are read when Octave starts, and only asked for again once
+        the path stamp of the session has changed, which it does after
+        any command that changed the working directory or the path.
+
+        Returns
+        -------
+        out : tuple (str, list, str)
+            Working directory, path directories in order and docstrings
+            file (None if unknown).
+
+        """
+        session = self._ready_session()
+        if self._path_query is None or self._path_stamp != session.path_stamp:
+            query = _search_path(self._eval(INDEX_QUERY, log=False,
+                                            verbose=False))
+            self._path_query = query
+            self._path_stamp = session.path_stamp
+            self._path_key = None
+        return self._path_query
+
+    def _path_state(self):
+        """Key of the current path for the function cache
+
+        Like the path itself, it is only worked out again after a command
+        that could change the path.
+
+        """
+        cwd, dirs, _ = self._search_path()
+        if self._path_key is None:
+            self._path_key = path_state(cwd, dirs)
+        return self._path_key
+
+    def _query(self, cmds):
+        """Ask Octave something that does not change the path, unlogged"""
+        session = self._ready_session()
+        fresh = self._path_stamp == session.path_stamp
+        resp = self._eval(cmds, log=False, verbose=False)
+        if fresh:
+            # without a status frame, every command changes the stamp
+            self._path_stamp = session.path_stamp
+        return resp
+
+    def _eval(self, cmds, verbose=True, log=True, wrap=True):
         """
         Perform raw Octave command.
 
@@ -327,6 +705,9 @@ class Oct2Py(object):
             Commands(s) to pass directly to Octave.
         verbose : bool, optional
              Log Octave output at info level.
+        wrap : bool, optional
+            Wrap the command(s) to report their status.  Unwrapped commands
+            must report it themselves, like __oct2py_call__.m.
 
         Returns
         -------
@@ -339,34 +720,129 @@ class Oct2Py(object):
             If the command(s) fail.
 
         """
+        if threading.current_thread() is not self._starter:
+            # wait for a background start, and report its failure
+            self.ready.result()
         if not self._session:
             raise Oct2PyError('No Octave Session')
         if isinstance(cmds, str):
             cmds = [cmds]
+        if self._pending_clears:
+            # piggyback clears of released handles on this command
+            names, self._pending_clears = self._pending_clears, []
+            cmds = list(cmds)
+            cmds[0] = 'clear -v {0}\n{1}'.format(' '.join(names), cmds[0])
+        if self._pending_reloads:
+            # and clears of functions whose m-files changed
+            names, self._pending_reloads = self._pending_reloads, []
+            cmds = list(cmds)
+            cmds[0] = 'clear -f {0}\n{1}'.format(' '.join(names), cmds[0])
         if verbose and log:
             [self.logger.info(line) for line in cmds]
         elif log:
             [self.logger.debug(line) for line in cmds]
+        if not wrap:
+            return self._session.evaluate(cmds, verbose, log, self.logger,
+                                          False)
         return self._session.evaluate(cmds, verbose, log, self.logger)
 
-    def _make_octave_command(self, name, doc=None):
-        """Create a wrapper to an Octave procedure or object
+    def reload(self, name):
+        """
+        Make Octave read the m-file for a function again.
+
+        Functions called through the dynamic wrappers are reloaded
+        automatically when their m-file changes.  Use this for other
+        changes, such as a new file that shadows the function.
+        The clear is sent with the next command.
 
-        Adapted from the mlabwrap project
+        Parameters
+        ----------
+        name : str
+            Function name.
 
         """
-        def octave_command(*args, **kwargs):
-            """ Octave command """
-            kwargs['nout'] = get_nout()
-            kwargs['verbose'] = kwargs.get('verbose', False)
-            self._eval('clear {}'.format(name), log=False, verbose=False)
-            kwargs['command'] = True
-            return self.call(name, *args, **kwargs)
-        # convert to ascii for pydoc
-        doc = doc.encode('ascii', 'replace').decode('ascii')
-        octave_command.__doc__ = "\n" + doc
-        octave_command.__name__ = name
-        return octave_command
+        self._sources.pop(name, None)
+        self._pending_reloads.append(name)
+
+    def _check_source(self, name):
+        """Reload a function if its m-file changed since it was last called
+
+        The file is looked up on the first call, from the function cache
+        if possible.  After that, the only cost is a stat of the file, and
+        the clear is sent with the call itself.
+
+        Raises
+        ------
+        Oct2PyError
+           If the function does not exist.
+
+        """
+        source = self._sources.get(name)
+        if source is None:
+            info = self._function_info(name)
+            if not info['exist']:
+                msg = '"{0}" is not a recognized octave command'.format(name)
+                raise Oct2PyError(msg)
+            self._sources[name] = (info['file'], info['mtime'])
+            return
+        path, old_mtime = source
+        if path is None:
+            return
+        new_mtime = mtime(path)
+        if new_mtime != old_mtime:
+            self._sources[name] = (path, new_mtime)
+            self._pending_reloads.append(name)
+
+    def _function_info(self, name, state=None):
+        """
+        Get what we know about an Octave function.
+
+        Looked up in the function cache first, which is shared with other
+        sessions of the same Octave version and path, and saved between
+        runs.  Otherwise one command clears the function, in case an older
+        version was loaded, and asks Octave about it.
+
+        Parameters
+        ----------
+        name : str
+            Function name.
+        state : str, optional
+            Path state to look it up for, the current one by default.
+
+        Returns
+        -------
+        out : dict
+            `file` (None for built-ins), `mtime`, `exist`, `nargin`,
+            `nargout` (None when not known) and `doc` (None until asked for).
+
+        """
+        cache = get_cache(self._session_version())
+        if state is None:
+            state = self._path_state()
+        info = cache.get(state, name)
+        if info is not None:
+            return info
+        resp = self._query("clear -f {0}\n__oct2py_info__('{0}')".format(name))
+        path, exist, nargin, nargout = resp.split('\n')[-4:]
+        path = path.strip() or None
+        info = dict(file=path, mtime=mtime(path) if path else None,
+                    exist=int(exist), nargin=_count(nargin),
+                    nargout=_count(nargout), doc=None)
+        if _cacheable(info):
+            cache.update(state, name, **info)
+        return info
+
+    def _session_version(self):
+        """Octave version of the running session"""
+        return self._ready_session().version
+
+    def _ready_session(self):
+        """The running session, once a background start has finished"""
+        if threading.current_thread() is not self._starter:
+            self.ready.result()
+        if not self._session:
+            raise Oct2PyError('No Octave Session')
+        return self._session
 
     def _get_doc(self, name):
         """
@@ -388,13 +864,33 @@ class Oct2Py(object):
            If the procedure or object does not exist.
 
         """
+        state = self._path_state()
+        info = self._function_info(name, state)
+        if info['doc'] is not None:
+            return info['doc']
         try:
-            doc = self._eval('help {0}'.format(name), log=False, verbose=False)
+            doc = self._query('help {0}'.format(name))
         except Oct2PyError:
             msg = '"{0}" is not a recognized octave command'.format(name)
             raise Oct2PyError(msg)
+        if _cacheable(info):
+            get_cache(self._session_version()).update(state, name, doc=doc)
         return doc
 
+    def __dir__(self):
+        """Attributes, plus the functions in the help index"""
+        names = set(dir(type(self))) | set(self.__dict__)
+        try:
+            functions = self._help_index().names()
+        except Oct2PyError:
+            functions = []
+        for name in functions:
+            if keyword.iskeyword(name):
+                name += '_'
+            if re.match(r'[A-Za-z]\w*$', name):
+                names.add(name)
+        return sorted(names)
+
     def __getattr__(self, attr):
         """Automatically creates a wapper to an Octave function or object.
 
@@ -415,47 +911,366 @@ class Oct2Py(object):
             name = attr[:-1]
         else:
             name = attr
-        doc = self._get_doc(name)
-        octave_command = self._make_octave_command(name, doc)
+        octave_command = _OctaveCommand(self, name)
         #!!! attr, *not* name, because we might have python keyword name!
         setattr(self, attr, octave_command)
         return octave_command
 
     def _set_graphics_toolkit(self):
-        try:
-            self._eval("graphics_toolkit('gnuplot')", False)
-        except Oct2PyError:  # pragma: no cover
-            pass  
-        # set up the plot renderer
-        self.run("""
-            global __oct2py_figures = [];
-            page_screen_output(0);
-            
-            function fig_create(src, event)
-              global __oct2py_figures;
-              __oct2py_figures(size(__oct2py_figures) + 1) = src;
-            end
-            
-            set(0, 'DefaultFigureCreateFcn', @fig_create);
-        """)
-        self._graphics_toolkit = 'gnuplot'
+        self._session.warm_up(self.logger)
+        self._graphics_toolkit = _toolkit(self._launch)
 
     def restart(self):
         '''Restart an Octave session in a clean state
         '''
-        self._session = _Session()
+        if self.__dict__.get('_writer'):
+            # let a background start finish before replacing it
+            self.ready.exception()
+            if self._session:
+                self._session.close()
+            self._writer.remove_file()
+            self._reader.remove_file()
+        self._session = None
+        self._generation += 1
+        self._refs = {}
+        self._pending_clears = []
+        self._pending_reloads = []
+        self._sources = {}
+        self._path_query = None
+        self._path_stamp = None
+        self._path_key = None
         self._first_run = True
         self._graphics_toolkit = None
-        self._reader = MatRead()
-        self._writer = MatWrite()
+        self._added_paths = set(self._launch['paths'])
+        self._reader = MatRead(self._shared_memory, self._bulk_min,
+                               self._strict_dtypes)
+        self._writer = MatWrite(self._shared_memory, self._inline_max,
+                                self._bulk_min, self._strict_dtypes)
+        self._starter = None
+        self.ready = Future()
+        if self._start == 'background':
+            # the helper thread does the warm up of the first call
+            self._first_run = False
+            self._starter = threading.Thread(target=self._start_session,
+                                             args=(self.ready,))
+            self._starter.daemon = True
+            self._starter.start()
+        else:
+            try:
+                self._session = self._new_session()
+            except Exception as err:
+                self.ready.set_exception(err)
+                raise
+            if self._graphics_toolkit:
+                self._first_run = False
+            self.ready.set_result(self)
+
+    def _new_session(self):
+        """Take a warm spare if we keep them, or start Octave"""
+        if self._spares:
+            session = self._spares.take()
+            self._graphics_toolkit = _toolkit(self._launch)
+        else:
+            session = _Session(**self._launch)
+        # the path was read as Octave started
+        self._path_query = session.search_path
+        self._path_stamp = session.path_stamp
+        self._path_key = None
+        return session
+
+    def _start_session(self, ready):
+        """Start and warm up Octave, then finish the `ready` future"""
+        try:
+            self._session = self._new_session()
+            if not self._graphics_toolkit:
+                self._set_graphics_toolkit()
+        except Exception as err:
+            ready.set_exception(err)
+        else:
+            ready.set_result(self)
+
+    @property
+    def stats(self):
+        """Transport settings and counts for the current session.
+
+        Returns
+        -------
+        out : Struct
+            `inline_max` and `bulk_min` thresholds (`bulk_min` is None when
+            shared memory is off), the number of values `sent` inline, by
+            MAT file and in bulk, the number `received` by MAT file and
+            in bulk, and the seconds spent in each phase of the `boot`
+            (None until the session has started).
+
+        """
+        stats = Struct()
+        stats.inline_max = self._inline_max
+        stats.bulk_min = self._bulk_min if self._shared_memory else None
+        stats.sent = Struct(self._writer.counts)
+        stats.received = Struct(self._reader.counts)
+        stats.boot = None
+        if self._session:
+            stats.boot = Struct(self._session.timings)
+        return stats
+
+
+class _OctaveCommand(object):
+    """Wrapper to an Octave function, made by `Oct2Py.__getattr__`.
+
+    Creating it does not involve Octave.  The documentation is only fetched
+    when `__doc__` is read, and is kept in the function cache.
+
+    Adapted from the mlabwrap project.
+
+    """
+    def __init__(self, octave, name):
+        self._octave = octave
+        self.__name__ = name
+
+    def __call__(self, *args, **kwargs):
+        kwargs['nout'] = get_nout()
+        kwargs['verbose'] = kwargs.get('verbose', False)
+        self._octave._check_source(self.__name__)
+        kwargs['command'] = True
+        return self._octave.call(self.__name__, *args, **kwargs)
+
+    @property
+    def __doc__(self):
+        try:
+            doc = self._octave._get_doc(self.__name__)
+        except Oct2PyError as err:
+            doc = str(err)
+        # convert to ascii for pydoc
+        return "\n" + doc.encode('ascii', 'replace').decode('ascii')
+
+    @property
+    def nargin(self):
+        """Number of inputs, negative with varargin, None if not known"""
+        return self._octave._function_info(self.__name__)['nargin']
+
+    @property
+    def nargout(self):
+        """Number of outputs, negative with varargout, None if not known"""
+        return self._octave._function_info(self.__name__)['nargout']
+
+    def __repr__(self):
+        return '<Octave function {0}>'.format(self.__name__)
+
+
+class _GlobalOct2Py(object):
+    """Stand-in for the global `octave` session.
+
+    Octave is only started when the session is first used, so importing
+    oct2py does not start a process.  Setting the OCT2PY_NO_GLOBAL
+    environment variable disables the global session.
+
+    """
+    def __init__(self):
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get_instance(self):
+        """Get the session, starting it if needed"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    if os.environ.get(NO_GLOBAL):
+                        msg = ('The global octave session is disabled by '
+                               '{0}, use Oct2Py() instead'.format(NO_GLOBAL))
+                        raise Oct2PyError(msg)
+                    object.__setattr__(self, '_instance', Oct2Py())
+        return self._instance
+
+    def __getattr__(self, attr):
+        # do not start Octave for introspection
+        if attr.startswith('__') and attr.endswith('__'):
+            raise AttributeError(attr)
+        return getattr(self._get_instance(), attr)
+
+    def __dir__(self):
+        return dir(self._get_instance())
+
+    def __setattr__(self, attr, value):
+        setattr(self._get_instance(), attr, value)
+
+    def __enter__(self):
+        return self._get_instance().__enter__()
+
+    def __exit__(self, type, value, traceback):
+        return self._get_instance().__exit__(type, value, traceback)
+
+    def __repr__(self):
+        if self._instance is None:
+            return '<global Oct2Py session, not started>'
+        return repr(self._instance)
+
+
+class _Spares(object):
+    """Started and warmed up Octave sessions, kept in reserve.
+
+    Each spare is started on its own thread, and a replacement is started
+    whenever one is taken.
+
+    """
+    def __init__(self, count, logger=None, launch=None):
+        self.logger = logger
+        self.launch = launch or {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for i in range(count):
+            self._refill()
+
+    def take(self):
+        """
+        Take a spare session, waiting for one if none is ready.
+
+        Raises
+        ======
+        Oct2PyError
+            If the spare could not be started.
+
+        """
+        session = self._queue.get()
+        self._refill()
+        if isinstance(session, Exception):
+            raise session
+        return session
+
+    def close(self):
+        """Close the spares, including the ones still starting"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                session = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(session, _Session):
+                session.close()
+
+    def _refill(self):
+        thread = threading.Thread(target=self._start)
+        thread.daemon = True
+        thread.start()
+
+    def _start(self):
+        try:
+            session = _Session(**self.launch)
+            session.warm_up(self.logger)
+        except Exception as err:
+            session = err
+        with self._lock:
+            if not self._closed:
+                self._queue.put(session)
+                return
+        if isinstance(session, _Session):
+            session.close()
+
+
+class _Output(object):
+    '''Printed output of a command, as it is read from stdout
+
+    Shared by the blocking and asyncio sessions.  The output ends with
+    the end marker once the command has run.  After a syntax error the
+    command never runs and no frame will come, so `feed` tells as soon as
+    the parser output is complete.
+    '''
+    def __init__(self):
+        self.data = bytearray()
+        self._error_pos = -1
+
+    def feed(self, chunk):
+        """
+        Add a chunk of output.
+
+        Returns
+        =======
+        out : bool
+            Whether the output now holds a complete syntax error report.
+
+        """
+        start = max(len(self.data) - len(SYNTAX_MSG), 0)
+        self.data.extend(chunk)
+        if self._error_pos < 0:
+            self._error_pos = self.data.find(SYNTAX_MSG, start)
+        # the parser output ends with a line pointing at the error
+        if self._error_pos >= 0:
+            caret = self.data.find(b'^', self._error_pos)
+            return caret >= 0 and self.data.find(b'\n', caret) >= 0
+        return False
+
+    def done(self):
+        """Whether the command has finished printing"""
+        return self.data.endswith(END_MARKER)
+
+    def text(self):
+        """The decoded output, without the end marker"""
+        data = self.data
+        if self.done():
+            data = data[:-len(END_MARKER)]
+        return _decode(data)
+
+
+def _frame_header(data):
+    '''Status, error message size and path stamp from the start of a frame
+    '''
+    _, status, size, stamp = struct.unpack(FRAME_FORMAT,
+                                           bytes(data[:FRAME_SIZE]))
+    return status, size, stamp
 
 
 class _Session(object):
     '''Low-level session Octave session interaction
+
+    On POSIX systems, Octave reports the end of each command through a
+    frame on a dedicated pipe: the bytes "OC2P", the status, the length
+    of the error message and the path stamp as uint32, then the message
+    itself.  The path stamp changes whenever the working directory or the
+    path differ from what they were after the previous command.
+    Printed output is read from stdout in large chunks up to an end
+    marker, so the cost per command does not grow with the number of
+    printed lines.  Elsewhere we fall back to scanning stdout line by line
+    for sentinel characters.
     '''
-    def __init__(self):
+    def __init__(self, executable='octave', args=None, env=None,
+                 paths=None, packages=None, graphics=True):
+        self._frame_fd = None
+        self.path_stamp = 0
+        self.graphics = graphics
+        self.executable = executable
+        self.args = PROFILES['default'] if args is None else args
+        self.env = env
+        self.paths = paths or []
+        self.timings = dict()
+        start = time.time()
         self.proc = self.start()
         atexit.register(self.close)
+        self.timings['spawn'] = time.time() - start
+        start = time.time()
+        self._read_boot(self.evaluate(BOOT_QUERY, False, False))
+        self.timings['first_prompt'] = time.time() - start
+        if packages:
+            start = time.time()
+            resp = self.evaluate(_preload(packages), False, False)
+            self.search_path = _search_path(resp)
+            self.timings['preload'] = time.time() - start
+
+    def _read_boot(self, resp):
+        """Read the version and path printed by `BOOT_QUERY`"""
+        # startup messages come first, and the version names cache files
+        version = resp.split('\n')[-4].strip()
+        self.version = re.sub(r'[^\w.+-]', '_', version) or 'unknown'
+        self.search_path = _search_path(resp)
+
+    def _command(self):
+        """Octave command line: the launch profile `args`, then --path for
+        our helper m-files and each of the preloaded `paths`
+        """
+        cmd = [self.executable] + list(self.args) + ['--path', HERE]
+        for path in self.paths:
+            cmd += ['--path', path]
+        return cmd
 
     def start(self):
         """
@@ -473,8 +1288,7 @@ class _Session(object):
 
         Notes
         =====
-        Options sent to Octave: -q is quiet startup, --braindead is
-        Matlab compatibilty mode.
+        See `_command` for the options sent to Octave.
 
         """
         ON_POSIX = 'posix' in sys.builtin_module_names
@@ -484,43 +1298,137 @@ class _Session(object):
             startupinfo = subprocess.STARTUPINFO()  
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
             kwargs['startupinfo'] = startupinfo
+        env = dict(os.environ, **(self.env or {}))
+        if self.env:
+            kwargs['env'] = env
+        frame_w = None
+        if ON_POSIX:
+            self._frame_fd, frame_w = os.pipe()
+            kwargs['env'] = dict(env, OCT2PY_FRAME_FD=str(frame_w))
+            if PY2:
+                kwargs['close_fds'] = False
+            else:
+                kwargs['pass_fds'] = (frame_w,)
         try:
-            proc = subprocess.Popen(['octave', '-q', '--braindead'], **kwargs)
+            proc = subprocess.Popen(self._command(), **kwargs)
         except OSError:  # pragma: no cover
             msg = ('\n\nPlease install GNU Octave and put it in your path\n')
             raise Oct2PyError(msg)
+        finally:
+            if frame_w is not None:
+                os.close(frame_w)
         return proc
 
-    def evaluate(self, cmds, verbose=True, log=True, logger=None):
+    def warm_up(self, logger=None):
+        '''Select the graphics toolkit and set up the plot renderer
+        '''
+        start = time.time()
+        if not self.graphics:
+            self.evaluate([HEADLESS_WARM_UP], False, True, logger)
+            self.timings['warm_up'] = time.time() - start
+            return
+        try:
+            self.evaluate(["graphics_toolkit('gnuplot')"], False, True,
+                          logger)
+        except Oct2PyError:  # pragma: no cover
+            pass
+        self.evaluate([WARM_UP], False, True, logger)
+        self.timings['warm_up'] = time.time() - start
+
+    def evaluate(self, cmds, verbose=True, log=True, logger=None, wrap=True):
         '''Perform the low-level interaction with an Octave Session
+
+        Unless `wrap` is set, the commands must send their own status
+        frame, and a status pipe is required.
         '''
         if not self.proc:
             raise Oct2PyError('Session Closed, try a restart()')
-        resp = []
-        # use ascii code 21 to signal an error and 3
-        # to signal end of text
-        lines = ['try', '\n'.join(cmds), 'disp(char(3))',
-                 'catch', 'disp(lasterr())', 'disp(char(21))',
-                 'end', '']
-        eval_ = '\n'.join(lines).encode('utf-8')
-        self.proc.stdin.write(eval_)
-        if len(cmds) == 5:
-            main_line = cmds[2].strip()
+        if self._frame_fd is None:
+            return self._evaluate_lines(cmds, verbose, log, logger)
+        if wrap:
+            lines = ['try', '\n'.join(cmds), '__oct2py_frame__(0, "")',
+                     'catch', '__oct2py_frame__(1, lasterr())',
+                     'end', '']
         else:
-            main_line = '\n'.join(cmds)
+            lines = ['\n'.join(cmds), '']
+        self._write('\n'.join(lines))
+        status, error, resp = self._read_frame()
+        if status == SYNTAX_ERROR:
+            msg = 'Octave Syntax Error:\n' + resp
+            msg += '\nSession Closed by Octave'
+            self.close()
+            raise Oct2PyError(msg)
+        if resp:
+            if verbose and logger:
+                logger.info(resp)
+            elif log and logger:
+                logger.debug(resp)
+        if status:
+            resp = '\n'.join([line for line in (resp, error) if line])
+            raise Oct2PyError(self._error_msg(cmds, resp))
+        return resp
+
+    def _write(self, text):
+        '''Send text to the Octave process'''
+        self.proc.stdin.write(text.encode('utf-8'))
         try:
             self.proc.stdin.flush()
         except OSError:  # pragma: no cover
             pass
+
+    def _read_frame(self):
+        '''Read the printed output and status frame of a command
+
+        Returns
+        =======
+        out : tuple (int, str, str)
+            Status code, error message and printed output.
+
+        '''
+        stdout = self.proc.stdout.fileno()
+        fds = [stdout, self._frame_fd]
+        output = _Output()
+        frame = bytearray()
+        while 1:
+            ready = select.select(fds, [], [])[0]
+            if stdout in ready:
+                chunk = os.read(stdout, BUFSIZE)
+                if not chunk:
+                    self.close()
+                    raise Oct2PyError('Session died unexpectedly')
+                if output.feed(chunk):
+                    return SYNTAX_ERROR, '', output.text()
+            if self._frame_fd in ready:
+                frame.extend(os.read(self._frame_fd, BUFSIZE))
+            if len(frame) >= FRAME_SIZE and output.done():
+                status, size, self.path_stamp = _frame_header(frame)
+                if len(frame) >= FRAME_SIZE + size:
+                    break
+        error = frame[FRAME_SIZE:FRAME_SIZE + size]
+        return status, _decode(error), output.text()
+
+    def _evaluate_lines(self, cmds, verbose, log, logger):
+        '''Evaluate without a frame pipe, scanning stdout for sentinels
+
+        Any command may have changed the path, so each one moves the path
+        stamp on.
+        '''
+        self.path_stamp += 1
+        resp = []
+        # use ascii code 21 to signal an error and 3
+        # to signal end of text
+        lines = ['try', '\n'.join(cmds), '__oct2py_refresh__()',
+                 'disp(char(3))',
+                 'catch', 'disp(lasterr())', 'disp(char(21))',
+                 'end', '']
+        self._write('\n'.join(lines))
         syntax_error = False
         while 1:
             line = self.proc.stdout.readline().rstrip().decode('utf-8')
             if line == '\x03':
                 break
             elif line == '\x15':
-                msg = ('Oct2Py tried to run:\n"""\n{0}\n"""\nOctave returned:\n{1}'
-                       .format(main_line, '\n'.join(resp)))
-                raise Oct2PyError(msg)
+                raise Oct2PyError(self._error_msg(cmds, '\n'.join(resp)))
             if "syntax error" in line:
                 syntax_error = True
             elif syntax_error and "^" in line:
@@ -536,6 +1444,15 @@ class _Session(object):
             resp.append(line)
         return '\n'.join(resp)
 
+    def _error_msg(self, cmds, resp):
+        '''Format the message for a failed command'''
+        if len(cmds) == 4:
+            main_line = cmds[1].strip()
+        else:
+            main_line = '\n'.join(cmds)
+        return ('Oct2Py tried to run:\n"""\n{0}\n"""\nOctave returned:\n{1}'
+                .format(main_line, resp))
+
     def close(self):
         '''Cleanly close an Octave session
         '''
@@ -548,11 +1465,134 @@ class _Session(object):
         except (OSError, AttributeError):  # pragma: no cover
             pass  
         self.proc = None
+        if self._frame_fd is not None:
+            os.close(self._frame_fd)
+            self._frame_fd = None
+
+
+def exist_line(names):
+    '''Octave command that fails if any of the variables do not exist
+    '''
+    return "__oct2py_exist__('{0}')".format("', '".join(names))
+
+
+def _call_line(func, argin_list, argout_list):
+    """Build the Octave command line that calls a function
+
+    Parameters
+    ----------
+    func : str
+        Function name.
+    argin_list : list
+        Expressions for the inputs.
+    argout_list : list
+        Variable names for the outputs.
+
+    Returns
+    -------
+    out : str
+        Command of the form "[a, b, c] = foo(A, B, C)".
+
+    """
+    call_line = ''
+    if argout_list:
+        call_line = '[{0}] = '.format(', '.join(argout_list))
+    if argin_list:
+        call_line += '{0}({1})'.format(func, ', '.join(argin_list))
+    elif argout_list:
+        # call foo() - no arguments
+        call_line += '{0}()'.format(func)
+    else:
+        # run foo
+        call_line += '{0}'.format(func)
+    return call_line
+
+
+def missing_error(err):
+    '''Turn an error from `exist_line` into one that names the variables
+
+    Other errors are returned as they are.
+    '''
+    match = MISSING.search(str(err))
+    if not match:
+        return err
+    missing = match.group(1).split()
+    error = Oct2PyError('{0} does not exist'.format(', '.join(missing)))
+    error.missing = missing
+    return error
+
+
+def _launch_options(executable, args, env, paths, packages, graphics):
+    '''Launch profile of a session, see `Oct2Py`
+
+    Raises
+    ------
+    ValueError
+        If `args` names an unknown profile.
+    '''
+    if not isinstance(args, (list, tuple)):
+        try:
+            args = PROFILES[args]
+        except KeyError:
+            raise ValueError('Unknown launch profile: {0}'.format(args))
+    return dict(executable=executable, args=list(args), env=env,
+                paths=list(paths or []), packages=list(packages or []),
+                graphics=graphics)
+
+
+def _preload(packages):
+    '''Commands that load packages at launch and read the new path
+    '''
+    return ['pkg load {0}'.format(' '.join(packages)), INDEX_QUERY]
+
+
+def _toolkit(launch):
+    '''Graphics toolkit set up by the warm up of a session
+    '''
+    return 'gnuplot' if launch['graphics'] else 'none'
+
+
+def _search_path(resp):
+    '''Parse the working directory, path and docstrings file printed by
+    `INDEX_QUERY`
+    '''
+    cwd, path, docstrings = resp.split('\n')[-3:]
+    cwd = cwd.strip()
+    dirs = [cwd if dirname == '.' else dirname
+            for dirname in path.strip().split(os.pathsep) if dirname]
+    return cwd, dirs, docstrings.strip() or None
+
+
+def _cacheable(info):
+    '''Whether function information can be saved for other sessions: only
+    for m-files, whose changes we can see, and compiled and built-in
+    functions
+    '''
+    return info['file'] is not None or info['exist'] in (3, 5)
+
+
+def _count(text):
+    '''Parse nargin or nargout from __oct2py_info__.m
+    '''
+    text = text.strip()
+    if text == 'NaN':
+        return None
+    return int(text)
+
+
+def _decode(data):
+    '''Decode Octave output, stripping trailing whitespace from each line
+    '''
+    text = bytes(data).decode('utf-8', 'replace')
+    if text.endswith('\n'):
+        text = text[:-1]
+    return TRAILING_SPACE.sub('', text)
 
 
 def _test():  # pragma: no cover
     """Run the doctests for this module.
     """
+    import doctest
     print('Starting doctest')  
     doctest.testmod()  
     print('Completed doctest')  
@@ -7,23 +7,34 @@
 
 """
 from __future__ import print_function
+import io
+import multiprocessing
+import sys
 import time
 import timeit
+import warnings
 import numpy as np
+from scipy.io import loadmat, savemat
+from .compat import queue
+from .matread import cell_to_array, get_data
 from .session import Oct2Py
+from .utils import Struct
 
 
 class SpeedCheck(object):
     """Checks the speed penalty of the Python to Octave bridge.
 
     Uses timeit to test the raw execution of a Octave command,
-    Then tests progressively larger array passing.
+    Then tests progressively larger array passing, and large cell and
+    struct arrays.
 
     """
-    def __init__(self):
+    def __init__(self, **kwargs):
         """Create our octave instance and initialize the data array
+
+        Keyword arguments are passed on to Oct2Py.
         """
-        self.octave = Oct2Py()
+        self.octave = Oct2Py(**kwargs)
         self.array = []
 
     def raw_speed(self):
@@ -67,21 +78,232 @@ class SpeedCheck(object):
             avg = timeit.timeit(self.large_array_get, number=nruns) / nruns
             print('    {0:0.01f} msec'.format(avg * 1e3))
 
+        cells = [('cell of strings', "x = repmat({'spam'}, 1, 100000);"),
+                 ('cell of vectors', 'x = num2cell(rand(3, 100000), 1);'),
+                 ('struct array', "x = struct('name', repmat({'spam'}, 1, "
+                                  "100000), 'age', num2cell(1:100000));")]
+        for (kind, cmd) in cells:
+            self.octave.run(cmd)
+            print('Get 100000 element {0}: '.format(kind))
+            avg = timeit.timeit(self.large_array_get, number=5) / 5
+            print('    {0:0.01f} msec'.format(avg * 1e3))
+
         self.octave.close()
         print('*' * 20)
         print('Test complete!')
 
 
-def speed_test():
+def speed_test(**kwargs):
     """Checks the speed penalty of the Python to Octave bridge.
 
     Uses timeit to test the raw execution of a Octave command,
     Then tests progressively larger array passing.
+    Keyword arguments are passed on to Oct2Py, e.g. `shared_memory=True`.
 
     """
-    test = SpeedCheck()
+    test = SpeedCheck(**kwargs)
     test.run()
 
 
+def peak_rss():
+    """Peak resident memory of this process in bytes (POSIX only)"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+def _put_memory(nbytes, dtype, order, kwargs, results):
+    """Measure the peak memory added by one `put`, in a fresh process"""
+    try:
+        octave = Oct2Py(**kwargs)
+    except Exception as err:
+        results.put(err)
+        return
+    try:
+        side = int(np.sqrt(nbytes // np.dtype(dtype).itemsize))
+        array = np.ones((side, side), dtype=dtype, order=order)
+        before = peak_rss()
+        start = time.time()
+        octave.put('x', array)
+        results.put((array.nbytes, peak_rss() - before, time.time() - start))
+    except Exception as err:
+        results.put(err)
+    finally:
+        octave.close()
+
+
+def _get_result(proc, results, poll=1.):
+    """Wait for the result of a test process, or None if it died first,
+    for example at the hands of the OOM killer"""
+    while True:
+        try:
+            return results.get(timeout=poll)
+        except queue.Empty:
+            if proc.is_alive():
+                continue
+        # a result may still be on its way from a process that just ended
+        try:
+            return results.get(timeout=poll)
+        except queue.Empty:
+            return None
+
+
+def memory_test(nbytes=2 ** 30, **kwargs):
+    """Checks the peak memory used to put a large array into Octave.
+
+    Each case runs in its own process, since the peak resident memory of a
+    process never goes down.  The extra peak is reported as a multiple of
+    the array size: the MAT file writer makes one copy of its own, so 1.0
+    means the value was marshalled without a copy.  A case whose process
+    dies, for example when it runs out of memory, is reported as failed.
+    Keyword arguments are passed on to Oct2Py, e.g. `shared_memory=True`.
+
+    """
+    print('oct2py memory test')
+    print('*' * 20)
+    cases = [('float64', 'C'), ('float64', 'F'), ('bool', 'F'),
+             ('complex128', 'F')]
+    for (dtype, order) in cases:
+        results = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_put_memory,
+                                       args=(nbytes, dtype, order, kwargs,
+                                             results))
+        proc.start()
+        result = _get_result(proc, results)
+        proc.join()
+        if isinstance(result, Exception):
+            raise result
+        if result is None:
+            print('Put {0} {1}-order: failed, the test process exited with '
+                  'code {2}'.format(dtype, order, proc.exitcode))
+            continue
+        size, extra, elapsed = result
+        print('Put {0} {1}-order, {2:0.02f} GB: '.format(dtype, order,
+                                                        size / 2. ** 30))
+        print('    {0:0.02f}x extra peak, {1:0.01f} sec'.format(extra / size,
+                                                               elapsed))
+    print('*' * 20)
+    print('Test complete!')
+
+
+def _legacy_get_data(val):
+    """The previous element by element `get_data`, as a baseline"""
+    # check for objects
+    if "'|O" in str(val.dtype) or "O'" in str(val.dtype):
+        data = Struct()
+        for key in val.dtype.fields.keys():
+            data[key] = _legacy_get_data(val[key][0])
+        return data
+    # handle cell arrays
+    if val.dtype == object:
+        if val.size == 1:
+            val = val[0]
+            if "'|O" in str(val.dtype) or "O'" in str(val.dtype):
+                val = _legacy_get_data(val)
+            if isinstance(val, Struct):
+                return val
+            if val.size == 1:
+                val = val.flatten()
+    if val.dtype == object:
+        if len(val.shape) > 2:
+            val = val.T
+            val = np.array([_legacy_get_data(val[i].T)
+                            for i in range(val.shape[0])])
+        if len(val.shape) > 1:
+            if len(val.shape) == 2:
+                val = val.T
+            try:
+                return val.astype(val[0][0].dtype)
+            except ValueError:
+                # dig into the cell type
+                for row in range(val.shape[0]):
+                    for i in range(val[row].size):
+                        if not np.isscalar(val[row][i]):
+                            if val[row][i].size > 1:
+                                val[row][i] = val[row][i].squeeze()
+                            else:
+                                val[row][i] = val[row][i][0]
+        else:
+            val = np.array([_legacy_get_data(val[i])
+                            for i in range(val.size)])
+        if len(val.shape) == 1 or val.shape[0] == 1 or val.shape[1] == 1:
+            val = val.flatten()
+        val = val.tolist()
+    elif val.size == 1:
+        if hasattr(val, 'flatten'):
+            val = val.flatten()[0]
+    return val
+
+
+def _cell(items):
+    """Make a 1xN cell array from a list"""
+    val = np.empty((1, len(items)), dtype=object)
+    for (i, item) in enumerate(items):
+        val[0, i] = item
+    return val
+
+
+def _best_time(func, val, nruns):
+    """Best time of `func` over `nruns` calls, each on a fresh copy"""
+    best = None
+    for _ in range(nruns):
+        data = val.copy()
+        start = time.time()
+        func(data)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def cell_benchmark(size=100000, nruns=5):
+    """Checks the speed of reading large cell and struct arrays.
+
+    Needs no Octave: the values are written with `savemat` in the layout
+    Octave uses and read back with `loadmat`, then the same output is
+    converted by the previous element by element `get_data`, the current
+    `get_data` (cell_array="lists"), and `cell_to_array`
+    (cell_array="arrays").
+
+    """
+    print('oct2py cell benchmark')
+    print('*' * 20)
+    names = ['spam'] * size
+    cases = [('cell of strings', _cell(names)),
+             ('cell of vectors', _cell([np.arange(3.).reshape(3, 1) + i
+                                        for i in range(size)])),
+             ('struct array', {'name': _cell(names),
+                               'age': _cell(list(range(size)))})]
+    for (kind, value) in cases:
+        mat = io.BytesIO()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            savemat(mat, {'x': value})
+        mat.seek(0)
+        val = loadmat(mat)['x']
+        if kind == 'struct array':
+            # a 1xN struct array, as Octave saves it
+            val = val[0, 0]
+            fields = np.empty((1, size), dtype=val.dtype)
+            for name in val.dtype.names:
+                for i in range(size):
+                    fields[name][0, i] = val[name][0, i]
+            val = fields
+        print('{0} element {1}: '.format(size, kind))
+        old = _best_time(_legacy_get_data, val, nruns)
+        new = _best_time(get_data, val, nruns)
+        print('    element by element: {0:0.01f} msec'.format(old * 1e3))
+        print('    lists: {0:0.01f} msec ({1:0.01f}x)'.format(new * 1e3,
+                                                             old / new))
+        if cell_to_array(val.copy()) is not None:
+            stacked = _best_time(cell_to_array, val, nruns)
+            print('    arrays: {0:0.01f} msec ({1:0.01f}x)'.format(
+                stacked * 1e3, old / stacked))
+    print('*' * 20)
+    print('Test complete!')
+
+
 if __name__ == '__main__':
     speed_test()
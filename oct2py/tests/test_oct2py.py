@@ -15,12 +15,14 @@ float16/96/128 and complex192/256 can be recast as float64 and complex128.
 from __future__ import absolute_import, print_function
 import logging
 import os
+import sys
+import threading
 import numpy as np
 import numpy.testing as test
 import pickle
 
 import oct2py
-from oct2py import Oct2Py, Oct2PyError
+from oct2py import Oct2Py, Oct2PyError, Oct2PyPool
 from oct2py.utils import Struct
 from oct2py.compat import unicode, long, PY2
 
@@ -595,11 +597,9 @@ class BasicUsageTest(test.TestCase):
         """
         tests = [octave.zeros, octave.ones, octave.plot]
         for test in tests:
-            try:
-                self.assertEqual(repr(type(test)), "<type 'function'>")
-            except AssertionError:
-                self.assertEqual(repr(type(test)), "<class 'function'>")
-        self.assertRaises(Oct2PyError, octave.__getattr__, 'aaldkfasd')
+            assert callable(test)
+            assert 'Octave function' in repr(test)
+        self.assertRaises(Oct2PyError, octave.aaldkfasd)
         self.assertRaises(Oct2PyError, octave.__getattr__, '_foo')
         self.assertRaises(Oct2PyError, octave.__getattr__, 'foo\W')
 
@@ -618,7 +618,7 @@ class BasicUsageTest(test.TestCase):
     def test_struct(self):
         """Test Struct construct
         """
-        test = Struct()
+        test = Struct.auto()
         test.spam = 'eggs'
         test.eggs.spam = 'eggs'
         self.assertEqual(test['spam'], 'eggs')
@@ -631,6 +631,39 @@ class BasicUsageTest(test.TestCase):
         self.assertEqual(test2['eggs']['spam'], 'eggs')
         self.assertEqual(test2.foo.bar, 10)
 
+    def test_struct_fast(self):
+        """Test Struct paths, pickling and freezing
+        """
+        test = Struct(spam='eggs')
+        self.assertRaises(AttributeError, getattr, test, 'eggs')
+        self.assertRaises(KeyError, test.__getitem__, 'eggs')
+        test.setdefault_path('foo.bar').baz = 10
+        test.setdefault_path(['foo', 'bar'])['fizz'] = 1
+        self.assertEqual(test.foo.bar, dict(baz=10, fizz=1))
+        assert type(test.foo) is Struct
+        test2 = pickle.loads(pickle.dumps(test))
+        assert type(test2) is Struct
+        self.assertEqual(test2, test)
+        frozen = test.freeze()
+        self.assertEqual(frozen.foo.bar.baz, 10)
+        self.assertEqual(frozen['spam'], 'eggs')
+        self.assertEqual(dict(frozen.foo.bar), dict(baz=10, fizz=1))
+        self.assertRaises(AttributeError, setattr, frozen, 'spam', 1)
+        assert not hasattr(frozen, '__dict__')
+        frozen2 = pickle.loads(pickle.dumps(frozen))
+        self.assertEqual(frozen2, frozen)
+        self.assertEqual(frozen2.thaw(), test)
+        methods = Struct(values=[1, 2], keys=3, items='a', name='b')
+        frozen = methods.freeze()
+        self.assertEqual(frozen['values'], [1, 2])
+        self.assertEqual(sorted(frozen.keys()), sorted(methods.keys()))
+        self.assertEqual(dict(frozen), methods)
+        self.assertEqual(frozen.name, 'b')
+        frozen2 = pickle.loads(pickle.dumps(frozen))
+        self.assertEqual(frozen2, frozen)
+        self.assertEqual(frozen2.thaw(), methods)
+        self.assertEqual(repr(frozen2), repr(frozen))
+
     def test_syntax_error(self):
         """Make sure a syntax error in Octave throws an Oct2PyError
         """
@@ -766,6 +799,709 @@ def test_trailing_underscore():
     assert np.allclose(x, np.ones(1))
 
 
+def test_shared_memory():
+    '''Make sure large arrays survive the shared memory transport'''
+    oc = Oct2Py(shared_memory=True)
+    tests = [np.random.rand(100, 50),
+             np.arange(3000, dtype=np.int16).reshape(10, 20, 15),
+             np.random.rand(1, 2000).astype(np.float32) + 1j,
+             np.asfortranarray(np.random.rand(40, 30))]
+    for test in tests:
+        oc.put('x', test)
+        incoming = oc.get('x')
+        assert incoming.shape == test.shape
+        assert incoming.dtype == test.dtype
+        assert np.allclose(incoming, test)
+    # Octave removes each file once it has been read
+    assert not os.listdir(oc._writer.bulk.in_dir)
+    # arrays that cannot be written to shared memory use the MAT file
+    in_dir, oc._writer.bulk.in_dir = oc._writer.bulk.in_dir, os.devnull
+    oc.put('x', tests[0])
+    assert np.allclose(oc.get('x'), tests[0])
+    assert oc.stats.sent.bulk == len(tests)
+    oc._writer.bulk.in_dir = in_dir
+    # small values and strings still go through the MAT file
+    oc.put(['y', 'z'], [1, 'spam'])
+    assert oc.get('y') == 1
+    assert oc.get('z') == 'spam'
+    U, S, V = oc.svd(np.random.rand(50, 50))
+    assert U.shape == S.shape == V.shape == (50, 50)
+    oc.close()
+
+
+def test_transport_selection():
+    '''Make sure each value takes the expected path'''
+    oc = Oct2Py(shared_memory=True, bulk_min=100)
+    tests = [1, 2.5, True, None, complex(1, 0), np.int16(3), np.float32(0.1),
+             'spam', "it's", 'x' * 100, [1, 2], np.random.rand(20, 10)]
+    for test in tests:
+        oc.put('x', test)
+        incoming = oc.get('x')
+        if test is None:
+            assert np.isnan(incoming)
+        elif isinstance(test, str):
+            assert incoming == test
+        else:
+            assert np.allclose(incoming, test)
+    stats = oc.stats
+    assert stats.inline_max == 64
+    assert stats.bulk_min == 100
+    assert stats.sent.inline == 9
+    assert stats.sent.mat == 2
+    assert stats.sent.bulk == 1
+    assert stats.received.bulk == 1
+    assert oc.call('class', np.int16(3)) == 'int16'
+    assert oc.call('class', True) == 'int8'
+    assert oc.call('iscomplex', complex(1, 0))
+    oc.close()
+
+
+def test_resident():
+    '''Make sure resident results stay in the session until released'''
+    oc = Oct2Py()
+    x = oc.call('ones', 3, 3, resident=True)
+    assert isinstance(x, oct2py.OctaveRef)
+    y = oc.sum(x, resident=True)
+    assert np.allclose(y.fetch(), [[3, 3, 3]])
+    assert np.allclose(np.asarray(y), [[3, 3, 3]])
+    U, S, V = oc.call('svd', x, resident=True)
+    assert np.allclose(oc.call('size', S), [[3, 3]])
+    name = x.name
+    assert oc.call('exist', name) == 1
+    del x
+    assert oc.call('exist', name) == 0
+    oc.put('z', 5)
+    z = oc.handle('z')
+    assert oc.call('plus', z, 1) == 6
+    del z
+    assert oc.get('z') == 5
+    other = Oct2Py()
+    test.assert_raises(Oct2PyError, other.call, 'sum', y)
+    oc.restart()
+    test.assert_raises(Oct2PyError, y.fetch)
+    oc.close()
+    other.close()
+
+
+def test_lazy():
+    '''Make sure recorded calls run together and give the right results'''
+    oc = Oct2Py()
+    x = np.random.rand(100)
+    with oc.lazy() as L:
+        f = L.fft(x)
+        y = L.max(L.abs(f))
+        z = L.plus(L.real(f), 1)
+    assert np.allclose(y.compute(), np.abs(np.fft.fft(x)).max())
+    y, z = L.compute(y, z)
+    assert np.allclose(z, np.fft.fft(x).real + 1)
+    ref = L.compute(L.zeros(2, 2), resident=True)
+    assert np.allclose(ref.fetch(), np.zeros((2, 2)))
+    assert not 'lazy' in oc.run('who')
+    oc.close()
+
+
+def test_batch():
+    '''Make sure queued calls run together and fail independently'''
+    oc = Oct2Py()
+    with oc.batch() as b:
+        futures = [b.ones(i, 2) for i in range(1, 40)]
+        svd = b.call('svd', [[1, 2], [1, 3]], nout=3)
+        bad = b.call('ones2', 1)
+        size = b.size(oc.call('zeros', 3, 4, resident=True))
+    for (i, future) in enumerate(futures):
+        assert future.done()
+        assert np.allclose(future.result(), np.ones((i + 1, 2)))
+    U, S, V = svd.result()
+    assert U.shape == S.shape == V.shape == (2, 2)
+    test.assert_raises(Oct2PyError, bad.result)
+    assert np.allclose(size.result(), [[3, 4]])
+    assert not 'batch' in oc.run('who')
+    oc.close()
+
+
+def test_batch_no_inputs():
+    '''Make sure a batch of calls without arguments is flushed'''
+    oc = Oct2Py()
+    with oc.batch() as b:
+        futures = [b.rand() for i in range(3)]
+        pi = b.call('pi')
+    for future in futures:
+        assert 0 <= future.result() <= 1
+    assert np.allclose(pi.result(), np.pi)
+    oc.close()
+
+
+def test_pool():
+    '''Make sure a pool keeps the input order and reports failures'''
+    with Oct2PyPool(2) as pool:
+        assert len(pool) == 2
+        assert pool.map('numel', [[1] * i for i in range(1, 6)]) == \
+            [1, 2, 3, 4, 5]
+        out = pool.starmap('ones', [(1, 2), (2, 1)])
+        assert out[0].shape == (1, 2) and out[1].shape == (2, 1)
+        assert sorted(pool.imap_unordered('numel', ['a', 'ab'])) == [1, 2]
+        future = pool.apply_async('svd', ([[1, 2], [1, 3]],), dict(nout=3))
+        assert len(future.result()) == 3
+        data = np.random.rand(3, 7)
+        assert np.allclose(pool.map_array('cumsum', data), np.cumsum(data, 0))
+        assert np.allclose(pool.map_array('sqrt', data[0], axis=0, chunks=3),
+                           np.sqrt(data[0]))
+        assert pool.map_array('numel', data, chunks=3, reduce='sum') == 21
+        assert pool.map_array('numel', data, chunks=3, reduce=max) == 9
+        test.assert_raises(ValueError, pool.map_array, 'numel', data)
+        test.assert_raises(ValueError, pool.map_array, 'sqrt', data[0])
+        test.assert_raises(ValueError, pool.map_array, 'sqrt', 1.)
+        try:
+            pool.map('ones', [1, 'spam'])
+        except Oct2PyError as err:
+            assert err.input == ('spam',)
+        else:  # pragma: no cover
+            raise AssertionError('Error not raised')
+    test.assert_raises(Oct2PyError, pool.map, 'ones', [1])
+
+
+def test_async():
+    '''Make sure asyncio sessions run calls concurrently'''
+    if sys.version_info < (3, 5):  # pragma: no cover
+        return
+    import asyncio
+    from oct2py import AsyncOct2Py, AsyncOct2PyPool
+    loop = asyncio.new_event_loop()
+    oc = AsyncOct2Py()
+    loop.run_until_complete(oc.put('x', [1, 2, 3]))
+    x, y = loop.run_until_complete(asyncio.gather(oc.get('x'),
+                                                  oc.ones(2, 3)))
+    assert np.allclose(x, [[1, 2, 3]])
+    assert y.shape == (2, 3)
+    test.assert_raises(Oct2PyError, loop.run_until_complete,
+                       oc.call('ones2', 1))
+    # paths to m-files are added to the session's path
+    path = os.path.join(os.path.dirname(__file__), 'test_datatypes.m')
+    data = loop.run_until_complete(oc.call(path))
+    assert data.num.int.int8 == -2 ** 7
+    oc.close()
+    pool = AsyncOct2PyPool(2)
+    out = loop.run_until_complete(pool.map('numel', ['a', 'ab', 'abc']))
+    assert out == [1, 2, 3]
+    pool.close()
+    # the launch profile is used, and aclose waits for Octave to exit
+    here = os.path.dirname(__file__)
+    oc = AsyncOct2Py(args='fast', paths=[here], env=dict(OCT2PY_TEST='spam'),
+                     graphics=False)
+    loop.run_until_complete(oc.start())
+    proc = oc._session.proc
+    assert loop.run_until_complete(oc.roundtrip(1)) == 1
+    assert loop.run_until_complete(oc.getenv('OCT2PY_TEST')) == 'spam'
+    loop.run_until_complete(oc.aclose())
+    assert proc.returncode is not None
+    test.assert_raises(ValueError, AsyncOct2Py, args='turbo')
+    loop.close()
+
+
+def test_executor():
+    '''Make sure the executor gives each worker its own session'''
+    try:
+        from oct2py import Oct2PyExecutor
+    except ImportError:  # pragma: no cover
+        return
+    with Oct2PyExecutor(2) as executor:
+        out = list(executor.map('numel', ['a', 'ab', 'abc']))
+        assert out == [1, 2, 3]
+        future = executor.submit('ones2', 1)
+        assert isinstance(future.exception(), Oct2PyError)
+
+        def put_get(value):
+            executor.session.put('x', value)
+            return executor.session.get('x')
+        futures = [executor.submit(put_get, i) for i in range(10)]
+        assert [f.result() for f in futures] == list(range(10))
+    test.assert_raises(RuntimeError, executor.submit, 'ones', 1)
+    test.assert_raises(Oct2PyError, getattr, executor, 'session')
+
+
+def test_lazy_import():
+    '''Make sure importing oct2py does not start Octave or load scipy'''
+    import subprocess
+    code = ('import sys, oct2py; print(repr(oct2py.octave)); '
+            'print("scipy" in sys.modules)')
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.decode().split() == ['<global', 'Oct2Py', 'session,', 'not',
+                                    'started>', 'False']
+    from oct2py.session import _GlobalOct2Py
+    proxy = _GlobalOct2Py()
+    os.environ['OCT2PY_NO_GLOBAL'] = '1'
+    try:
+        test.assert_raises(Oct2PyError, getattr, proxy, 'ones')
+    finally:
+        del os.environ['OCT2PY_NO_GLOBAL']
+    assert not hasattr(proxy, '__wrapped__')
+    assert 'not started' in repr(proxy)
+    assert proxy.ones(1) == 1
+    proxy.close()
+
+
+def test_background_start():
+    '''Make sure a background start overlaps and early calls wait'''
+    oc = Oct2Py(start='background')
+    assert oc.ones(1) == 1
+    assert oc.ready.done() and oc.ready.result() is oc
+    assert oc._graphics_toolkit == 'gnuplot'
+    oc.restart()
+    oc.put('x', 2)
+    assert oc.get('x') == 2
+    oc.close()
+    test.assert_raises(ValueError, Oct2Py, start='later')
+
+
+def test_spares():
+    '''Make sure restart swaps in a warm spare session'''
+    oc = Oct2Py(spares=1)
+    assert oc._graphics_toolkit == 'gnuplot'
+    oc.put('x', 1)
+    oc._spares.take().close()
+    first = oc._session
+    oc.restart()
+    assert oc._session is not first and first.proc is None
+    assert not 'x' in oc.run('who')
+    assert oc.ones(1) == 1
+    oc.close()
+
+
+def test_launch_profile():
+    '''Make sure the launch profile is used and the boot is timed'''
+    here = os.path.dirname(__file__)
+    oc = Oct2Py(args='fast', paths=[here], env=dict(OCT2PY_TEST='spam'))
+    assert '--norc' in oc._session.proc.args
+    assert oc.roundtrip(1) == 1
+    assert oc.getenv('OCT2PY_TEST') == 'spam'
+    boot = oc.stats.boot
+    assert sorted(boot.keys()) == ['first_prompt', 'spawn', 'warm_up']
+    assert all(value >= 0 for value in boot.values())
+    oc.close()
+    test.assert_raises(ValueError, Oct2Py, args='turbo')
+
+
+def test_restart_failure():
+    '''Make sure a failed start does not leave close waiting'''
+    oc = Oct2Py()
+    oc._launch['executable'] = 'oct2py_no_such_octave'
+    test.assert_raises(Oct2PyError, oc.restart)
+    assert isinstance(oc.ready.exception(timeout=1), Oct2PyError)
+    closer = threading.Thread(target=oc.close)
+    closer.daemon = True
+    closer.start()
+    closer.join(5)
+    assert not closer.is_alive()
+
+
+def test_get_missing():
+    '''Make sure get reports every missing variable at once'''
+    oc = Oct2Py()
+    oc.put('x', 1)
+    names = ['x', 'spam', 'eggs']
+    try:
+        oc.get(names)
+    except Oct2PyError as err:
+        assert err.missing == ['spam', 'eggs']
+    else:  # pragma: no cover
+        raise AssertionError('Error not raised')
+    assert names == ['x', 'spam', 'eggs']
+    assert oc.get('x') == 1
+    oc.close()
+
+
+def test_reload():
+    '''Make sure changed m-files are reloaded without a clear per call'''
+    import tempfile
+    import shutil
+    dirname = tempfile.mkdtemp()
+    path = os.path.join(dirname, 'oct2py_reload.m')
+
+    def write(value):
+        with open(path, 'w') as fid:
+            fid.write('function y = oct2py_reload()\ny = {0};\n'.format(value))
+        mtime = os.path.getmtime(path) + value
+        os.utime(path, (mtime, mtime))
+
+    oc = Oct2Py()
+    try:
+        write(1)
+        oc.addpath(dirname)
+        assert oc.oct2py_reload() == 1
+        calls = []
+        evaluate = oc._session.evaluate
+        oc._session.evaluate = lambda *args: calls.append(1) or evaluate(*args)
+        assert oc.oct2py_reload() == 1
+        assert len(calls) == 1
+        write(2)
+        assert oc.oct2py_reload() == 2
+        assert len(calls) == 2
+        oc.reload('oct2py_reload')
+        assert oc.call('oct2py_reload') == 2
+    finally:
+        oc.close()
+        shutil.rmtree(dirname)
+
+
+def test_function_cache():
+    '''Make sure docs are fetched lazily and function info is cached'''
+    import tempfile
+    import shutil
+    from oct2py import cache
+    dirname = tempfile.mkdtemp()
+    cache_dir = cache.CACHE_DIR
+    cache.CACHE_DIR = dirname
+    oc = Oct2Py()
+    try:
+        calls = []
+        evaluate = oc._session.evaluate
+        oc._session.evaluate = lambda *args: calls.append(1) or evaluate(*args)
+        ones = oc.ones
+        assert not calls
+        assert 'ones' in ones.__doc__
+        # the cache file is written when a session closes
+        assert not os.listdir(dirname)
+        oc2 = Oct2Py()
+        try:
+            calls = []
+            evaluate = oc2._session.evaluate
+            oc2._session.evaluate = (lambda *args: calls.append(1) or
+                                     evaluate(*args))
+            assert oc2.ones.__doc__ == ones.__doc__
+            # the path was read at startup
+            assert not calls
+        finally:
+            oc2.close()
+        assert os.listdir(dirname)
+    finally:
+        oc.close()
+        cache.CACHE_DIR = cache_dir
+        shutil.rmtree(dirname)
+
+
+def forget_caches(dirname):
+    '''Drop the caches loaded from a directory, as a new process would'''
+    from oct2py import cache
+    for key in list(cache._CACHES):
+        if key[1] and key[1].startswith(dirname):
+            del cache._CACHES[key]
+
+
+def test_function_cache_round_trips():
+    '''Make sure a session with a warm cache only sends the calls'''
+    import tempfile
+    import shutil
+    from oct2py import cache
+    dirname = tempfile.mkdtemp()
+    cache_dir = cache.CACHE_DIR
+    cache.CACHE_DIR = dirname
+    names = ['ones', 'cosd', 'linspace', 'fliplr']
+    try:
+        with Oct2Py() as oc:
+            for name in names:
+                getattr(oc, name)(1)
+        assert len(os.listdir(dirname)) == 1
+        # a new process loads the cache from the file
+        forget_caches(dirname)
+        oc = Oct2Py()
+        oc.run('1;')
+        calls = []
+        evaluate = oc._session.evaluate
+        oc._session.evaluate = lambda *args: calls.append(1) or evaluate(*args)
+        for name in names:
+            getattr(oc, name)(1)
+        assert len(calls) == len(names)
+        # a command that changes the path makes us ask for it again
+        oc.cd(os.path.dirname(__file__))
+        calls = []
+        assert oc.roundtrip(1) == 1
+        assert len(calls) == 3
+        oc.close()
+    finally:
+        forget_caches(dirname)
+        cache.CACHE_DIR = cache_dir
+        shutil.rmtree(dirname)
+
+
+def test_function_cache_path():
+    '''Make sure cached functions are looked up for the session's path'''
+    import tempfile
+    import shutil
+    from oct2py import cache
+    from oct2py.session import _cacheable
+    dirname = tempfile.mkdtemp()
+    cache_dir = cache.CACHE_DIR
+    cache.CACHE_DIR = dirname
+    projects = []
+    for value in [1, 2]:
+        project = tempfile.mkdtemp()
+        with open(os.path.join(project, 'oct2py_proj.m'), 'w') as fid:
+            fid.write('function y = oct2py_proj()\n  y = {0};\n'.format(value))
+        projects.append(project)
+    octs = []
+    try:
+        for (value, project) in zip([1, 2], projects):
+            oc = Oct2Py()
+            octs.append(oc)
+            oc.run("cd('{0}')".format(project))
+            assert oc.oct2py_proj() == value
+            info = oc._function_info('oct2py_proj')
+            found = os.path.realpath(os.path.dirname(info['file']))
+            assert found == os.path.realpath(project)
+        assert not _cacheable(dict(file=None, exist=103))
+    finally:
+        for oc in octs:
+            oc.close()
+        cache.CACHE_DIR = cache_dir
+        for path in [dirname] + projects:
+            shutil.rmtree(path)
+
+
+def test_search():
+    '''Make sure functions are found from the help index'''
+    import time
+    results = dict(octave.search('cosine degrees'))
+    assert 'cosd' in results
+    assert not 'cos' in results
+    start = time.time()
+    assert 'cosd' in octave.lookfor('cos')
+    assert time.time() - start < 1
+    names = dir(octave)
+    assert 'ones' in names
+    assert 'search' in names
+
+
+def test_search_index_size():
+    '''Make sure the help index only keeps recent path directories'''
+    import tempfile
+    import shutil
+    import json
+    from oct2py import cache
+    dirname = tempfile.mkdtemp()
+    folders = [tempfile.mkdtemp(dir=dirname) for i in range(4)]
+    max_dirs = cache.MAX_DIRS
+    cache.MAX_DIRS = 2
+    try:
+        path = os.path.join(dirname, 'index.json')
+        index = cache.HelpIndex(path)
+        for folder in folders:
+            with open(os.path.join(folder, 'oct2py_f.m'), 'w') as fid:
+                fid.write('% spam\nfunction oct2py_f()\n')
+            index.update([folder])
+        index.update(folders[:3])
+        with open(path) as fid:
+            saved = json.load(fid)['dirs']
+        assert sorted(saved) == sorted(folders[:3])
+        assert index.search('spam') == [('oct2py_f', 'spam')]
+    finally:
+        cache.MAX_DIRS = max_dirs
+        shutil.rmtree(dirname)
+
+
+def test_headless():
+    '''Make sure a headless session runs calls without plotting code'''
+    oc = Oct2Py(graphics=False)
+    try:
+        sent = []
+        evaluate = oc._session.evaluate
+        oc._session.evaluate = (lambda cmds, *args: sent.extend(cmds) or
+                                evaluate(cmds, *args))
+        test.assert_allclose(oc.ones(2), np.ones((2, 2)))
+        assert not '__oct2py_figures' in '\n'.join(sent)
+        assert not 'refresh' in '\n'.join(sent)
+    finally:
+        oc.close()
+
+
+def test_lean_call():
+    '''Make sure a lean call is sent as one line and gives the same results'''
+    oc = Oct2Py()
+    try:
+        sent = []
+        evaluate = oc._session.evaluate
+        oc._session.evaluate = (lambda cmds, *args: sent.extend(cmds) or
+                                evaluate(cmds, *args))
+        x = np.random.rand(3, 4)
+        test.assert_allclose(oc.call('plus', x, 1, lean=True), x + 1)
+        assert sent[-1].startswith('__oct2py_call__')
+        assert not '\n' in sent[-1]
+        U, S, V = oc.call('svd', x, nout=3, lean=True)
+        test.assert_allclose(U.dot(S).dot(V.T), x)
+        try:
+            oc.call('ones', 'foo', lean=True)
+        except Oct2PyError as err:
+            assert '__oct2py_call__' in str(err)
+        else:
+            raise AssertionError('Oct2PyError not raised')
+        assert oc.call('ones', 1, lean=True) == 1
+    finally:
+        oc.close()
+
+
+def test_large_cells():
+    '''Make sure large uniform cells are converted in bulk, by value'''
+    oc = Oct2Py()
+    try:
+        oc.run("x = repmat({'spam'}, 1, 10000);")
+        x = oc.get('x')
+        assert isinstance(x, list) and len(x) == 10000
+        assert x[0] == 'spam' and x[-1] == 'spam'
+        oc.run('y = num2cell(reshape(1:30000, 3, 10000), 1);')
+        y = oc.get('y')
+        assert isinstance(y, list) and len(y) == 10000
+        test.assert_allclose(y[-1], [29998, 29999, 30000])
+        y[0][0] = -1
+        assert y[1][0] == 4
+        oc.run('z = {[1 2], [3 4 5]};')
+        z = oc.get('z')
+        test.assert_allclose(z[1], [3, 4, 5])
+        oc.run("s = struct('age', num2cell(1:1000));")
+        assert oc.get('s').age == list(range(1, 1001))
+    finally:
+        oc.close()
+
+
+def test_function_cache_user_path():
+    '''Make sure path changes made by user code are noticed'''
+    import tempfile
+    import shutil
+    setup, project = tempfile.mkdtemp(), tempfile.mkdtemp()
+    with open(os.path.join(setup, 'oct2py_setup_paths.m'), 'w') as fid:
+        fid.write("function oct2py_setup_paths()\n  addpath('{0}');\n"
+                  .format(project))
+    with open(os.path.join(project, 'oct2py_proj.m'), 'w') as fid:
+        fid.write('function y = oct2py_proj()\n  y = 3;\n')
+    oc = Oct2Py()
+    try:
+        oc.addpath(setup)
+        state = oc._path_state()
+        oc.oct2py_setup_paths()
+        assert oc._path_state() != state
+        assert oc.oct2py_proj() == 3
+        info = oc._function_info('oct2py_proj')
+        found = os.path.realpath(os.path.dirname(info['file']))
+        assert found == os.path.realpath(project)
+    finally:
+        oc.close()
+        for path in [setup, project]:
+            shutil.rmtree(path)
+
+
+def test_struct_array_columns():
+    '''Make sure struct arrays can be returned as columns or records'''
+    oc = Oct2Py()
+    try:
+        oc.run("s = struct('name', {'Sharon', 'Bill'}, 'age', {31, 42}, "
+               "'pos', {[1 2], [3 4]});")
+        cols = oc.get('s', struct_array='columns')
+        assert isinstance(cols, Struct)
+        test.assert_allclose(cols.age, [31, 42])
+        assert list(cols.name) == ['Sharon', 'Bill']
+        test.assert_allclose(cols.pos, [[1, 2], [3, 4]])
+        rec = oc.get('s', struct_array='records')
+        assert rec.shape == (2,)
+        assert rec[1]['name'] == 'Bill' and rec[1]['age'] == 42
+        assert rec['pos'].shape == (2, 2)
+        assert oc.get('s').age == [31, 42]
+        cols, x = oc.call('deal', oc.handle('s'), 1, nout=2,
+                          struct_array='columns')
+        assert x == 1 and list(cols.name) == ['Sharon', 'Bill']
+        test.assert_raises(ValueError, oc.get, 's', struct_array='rows')
+    finally:
+        oc.close()
+
+
+def test_struct_array_columns_bulk():
+    '''Make sure columns are not read from stale shared memory files'''
+    oc = Oct2Py(shared_memory=True)
+    try:
+        oc.put('x', 1)
+        # as left behind by an earlier call that failed
+        path = os.path.join(oc._reader.bulk.out_dir, 'x')
+        oc.call('__oct2py_bulk_write__', path, np.arange(2000.), nout=0)
+        assert oc.get('x', struct_array='columns') == 1
+    finally:
+        oc.close()
+
+
+def test_cell_array():
+    '''Make sure row and column cells can be returned as one array'''
+    oc = Oct2Py()
+    try:
+        oc.run("c = {'spam', 'eggs', 'ham'}; v = num2cell(rand(3, 4), 1);"
+               "m = {1, 'a'};")
+        names = oc.get('c', cell_array='arrays')
+        assert isinstance(names, np.ndarray)
+        assert names.tolist() == ['spam', 'eggs', 'ham']
+        v = oc.get('v')
+        vecs = oc.get('v', cell_array='arrays')
+        assert vecs.shape == (4, 3)
+        test.assert_allclose(vecs, v)
+        assert oc.get('m', cell_array='arrays') == oc.get('m')
+        out = oc.call('deal', oc.handle('c'), cell_array='arrays')
+        assert out.tolist() == ['spam', 'eggs', 'ham']
+        test.assert_raises(ValueError, oc.get, 'c', cell_array='tuples')
+    finally:
+        oc.close()
+
+
+def test_put_no_copy():
+    '''Make sure arrays are marshalled without a copy, in their own layout'''
+    from oct2py.matwrite import putval
+    x = np.asfortranarray(np.arange(12.).reshape(3, 4))
+    out = putval(x)
+    assert np.shares_memory(out, x) and out.flags.f_contiguous
+    y = np.array([True, False])
+    assert np.shares_memory(putval(y), y) and putval(y).dtype == np.int8
+    z = np.ones(3, dtype=complex)
+    assert np.all(putval(z).imag == 1e-9) and np.all(z.imag == 0)
+    oc = Oct2Py()
+    try:
+        oc.put(['x', 'y'], [x, y])
+        test.assert_allclose(oc.get('x'), x)
+        test.assert_allclose(oc.get('y'), [[1, 0]])
+    finally:
+        oc.close()
+
+
+def test_strict_dtypes():
+    '''Make sure strict mode keeps narrow types and the caller's arrays'''
+    oc = Oct2Py(strict_dtypes=True)
+    try:
+        mask = np.array([[True, False, True]])
+        assert oc.call('class', mask) == 'logical'
+        assert oc.call('class', True) == 'logical'
+        oc.put('mask', mask)
+        out = oc.get('mask')
+        assert out.dtype == np.bool_
+        test.assert_array_equal(out, mask)
+        z = np.array([[1, 2]], dtype=np.complex64)
+        assert oc.call('iscomplex', z)
+        oc.put('z', z)
+        out = oc.get('z')
+        assert out.dtype == np.complex64
+        test.assert_array_equal(out, z)
+        assert np.all(z.imag == 0)
+        for dtype in [np.float32, np.int16, np.uint8]:
+            x = np.arange(6, dtype=dtype).reshape(2, 3)
+            oc.put('x', x)
+            out = oc.get('x')
+            assert out.dtype == dtype
+            test.assert_array_equal(out, x)
+    finally:
+        oc.close()
+
+
+def test_long_output():
+    '''Make sure chatty commands come back intact'''
+    oc = Oct2Py()
+    out = oc.run('for i = 1:2000 disp(i) end')
+    lines = out.split('\n')
+    assert len(lines) == 2000
+    assert lines[0] == '1' and lines[-1] == '2000'
+    oc.close()
+
+
 def test_using_closed_session():
     oc = Oct2Py()
     oc.close()
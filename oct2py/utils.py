@@ -10,7 +10,8 @@ import inspect
 import dis
 import tempfile
 import atexit
-from oct2py.compat import PY2
+import threading
+from oct2py.compat import PY2, unicode, Mapping
 
 
 def _remove_temp_files():
@@ -85,51 +86,34 @@ class Struct(dict):
     """
     Octave style struct, enhanced.
 
-    Supports dictionary and attribute style access.  Can be pickled,
-    and supports code completion in a REPL.
+    Supports dictionary and attribute style access, with the speed of a
+    plain dict for both.  Missing members are not created on access: use
+    `setdefault_path`, or build the struct with `Struct.auto`.  Pickles as
+    a plain dict, supports code completion in a REPL, and can be turned
+    into a compact, read-only `FrozenStruct` with `freeze`.
 
     Examples
     ========
     >>> from oct2py import Struct
-    >>> a = Struct()
+    >>> a = Struct.auto()
     >>> a.b = 'spam'  # a["b"] == 'spam'
     >>> a.c["d"] = 'eggs'  # a.c.d == 'eggs'
-    >>> print(a)
-    {'c': {'d': 'eggs'}, 'b': 'spam'}
+    >>> a.setdefault_path('e.f').g = 1  # a.e.f.g == 1
+    >>> print(a.c)
+    {'d': 'eggs'}
 
     """
+    __slots__ = ()
+
     def __getattr__(self, attr):
         """Access the dictionary keys for unknown attributes."""
-        try:
-            return self[attr]
-        except KeyError:
-            msg = "'Struct' object has no attribute %s" % attr
-            raise AttributeError(msg)
-
-    def __getitem__(self, attr):
-        """
-        Get a dict value; create a Struct if requesting a Struct member.
-
-        Do not create a key if the attribute starts with an underscore.
-        """
-        if attr in self.keys() or attr.startswith('_'):
-            return dict.__getitem__(self, attr)
-        frame = inspect.currentframe()
-        # step into the function that called us
-        if frame.f_back.f_back and self._is_allowed(frame.f_back.f_back):
-            dict.__setitem__(self, attr, Struct())
-        elif self._is_allowed(frame.f_back):
-            dict.__setitem__(self, attr, Struct())
-        return dict.__getitem__(self, attr)
-            
-    def _is_allowed(self, frame):
-        """Check for allowed op code in the calling frame"""
-        allowed = [dis.opmap['STORE_ATTR'], dis.opmap['LOAD_CONST'],
-                   dis.opmap['STOP_CODE']]
-        bytecode = frame.f_code.co_code
-        instruction = bytecode[frame.f_lasti + 3]
-        instruction = ord(instruction) if PY2 else instruction
-        return instruction in allowed
+        if not attr.startswith('_'):
+            try:
+                return self[attr]
+            except KeyError:
+                pass
+        msg = "'Struct' object has no attribute %s" % attr
+        raise AttributeError(msg)
 
     __setattr__ = dict.__setitem__
     __delattr__ = dict.__delitem__
@@ -139,6 +123,214 @@ class Struct(dict):
         """Allow for code completion in a REPL"""
         return self.copy()
 
+    def __reduce__(self):
+        """Pickle the items once, as a plain dict"""
+        return (type(self), (dict(self),))
+
+    @classmethod
+    def auto(cls):
+        """
+        Create a struct whose missing members are created on access.
+
+        Nested members made this way are also created on access.
+
+        Returns
+        =======
+        out : Struct
+            An empty struct.
+
+        """
+        return _AutoStruct()
+
+    def setdefault_path(self, path):
+        """
+        Get a nested member, creating the missing structs on the way.
+
+        Parameters
+        ==========
+        path : str or list
+            Member names, as a list or separated by dots ('a.b.c').
+
+        Returns
+        =======
+        out : object
+            The member at the end of the path.
+
+        """
+        if isinstance(path, (str, unicode)):
+            path = path.split('.')
+        node = self
+        for name in path:
+            try:
+                node = node[name]
+            except KeyError:
+                node[name] = Struct()
+                node = node[name]
+        return node
+
+    def freeze(self):
+        """
+        Make a read-only copy, with nested structs frozen too.
+
+        Returns
+        =======
+        out : FrozenStruct
+            The frozen copy.
+
+        """
+        values = []
+        for value in self.values():
+            if isinstance(value, Struct):
+                value = value.freeze()
+            values.append(value)
+        return _make_frozen(tuple(self.keys()), tuple(values))
+
+
+class _AutoStruct(Struct):
+    """Struct that creates missing members on access, see `Struct.auto`"""
+    __slots__ = ()
+
+    def __missing__(self, key):
+        value = _AutoStruct()
+        dict.__setitem__(self, key, value)
+        return value
+
+
+class FrozenStruct(Mapping):
+    """
+    Compact, read-only struct made by `Struct.freeze`.
+
+    The values are kept in a tuple, with the member names shared by all
+    the frozen structs that have the same members, so there is no dict
+    per instance.  Supports attribute style access for members that do
+    not clash with a method, and the read-only dict interface.  Pickles
+    as its member names and values.
+
+    """
+    __slots__ = ('_fields', '_index', '_values')
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._index[key]]
+        except (KeyError, TypeError):
+            raise KeyError(key)
+
+    def __getattr__(self, attr):
+        """Access the members for unknown attributes."""
+        if not attr.startswith('_'):
+            try:
+                return self[attr]
+            except KeyError:
+                pass
+        msg = "'FrozenStruct' object has no attribute %s" % attr
+        raise AttributeError(msg)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError('FrozenStruct is read-only')
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        return (_make_frozen, (self._fields, self._values))
+
+    def __repr__(self):
+        return 'FrozenStruct({0!r})'.format(dict(zip(self._fields,
+                                                     self._values)))
+
+    def thaw(self):
+        """
+        Make a mutable copy, with nested structs thawed too.
+
+        Returns
+        =======
+        out : Struct
+            The copy.
+
+        """
+        data = Struct()
+        for (key, value) in zip(self._fields, self._values):
+            if isinstance(value, FrozenStruct):
+                value = value.thaw()
+            data[key] = value
+        return data
+
+
+# member indices of the frozen structs, by member names
+_FROZEN = {}
+
+
+def _make_frozen(fields, values):
+    """Create a FrozenStruct with the given members"""
+    index = _FROZEN.get(fields)
+    if index is None:
+        index = dict((field, i) for (i, field) in enumerate(fields))
+        _FROZEN[fields] = index
+    obj = object.__new__(FrozenStruct)
+    object.__setattr__(obj, '_fields', fields)
+    object.__setattr__(obj, '_index', index)
+    object.__setattr__(obj, '_values', tuple(values))
+    return obj
+
+
+class Future(object):
+    """
+    Result of an Octave call that has not finished yet.
+
+    A minimal, thread safe subset of `concurrent.futures.Future`.
+
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        """Whether the call has finished"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call and return its result.
+
+        Parameters
+        ==========
+        timeout : float, optional
+            Seconds to wait, forever by default.
+
+        Raises
+        ======
+        Oct2PyError
+            If the call failed, or did not finish in time.
+
+        """
+        self._wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait for the call and return its exception, if any"""
+        self._wait(timeout)
+        return self._exception
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done.set()
+
+    def _wait(self, timeout):
+        if not self._done.wait(timeout) and not self._done.is_set():
+            raise Oct2PyError('Timed out waiting for the result')
+
 
 def get_log(name=None):
     """Return a console logger.
@@ -199,7 +391,7 @@ if __name__ == "__main__":  # pragma: no cover
 #    import doctest
     #_test()
     import pickle
-    a = Struct()
+    a = Struct.auto()
     a['foo'] = 3
     a['bar'] = 2
     a.baz['bar'] = 1
@@ -211,7 +403,7 @@ if __name__ == "__main__":  # pragma: no cover
     #a['fizz'].yappy
     #a.micro
     #a.baz.dodo
-    test = Struct()
+    test = Struct.auto()
     test.spam = 'eggs'
     test.eggs.spam = 'eggs'
     test["foo"]["bar"] = 10
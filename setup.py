@@ -10,7 +10,7 @@ LICENSE = 'MIT'
 REQUIRES = ["numpy (>= 1.6.0)", "scipy (>= 0.9.0)"]
 PACKAGES = [DISTNAME, '%s.tests' % DISTNAME, '%s/ipython' % DISTNAME, 
             '%s/ipython/tests' % DISTNAME]
-PACKAGE_DATA = {DISTNAME: ['tests/*.m']}
+PACKAGE_DATA = {DISTNAME: ['*.m', 'tests/*.m']}
 CLASSIFIERS = """\
 Development Status :: 5 - Production/Stable
 Intended Audience :: Developers